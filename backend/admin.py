@@ -1,9 +1,11 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from django.contrib.auth.admin import UserAdmin
-from backend.forms import CustomUserCreationForm, CustomUserChangeForm
+from backend.forms import CustomUserCreationForm, CustomUserChangeForm, PriceRuleForm
 
-from backend.models import Category, AdminUser, CustomerUser, Product, Cart, OrderItem, Order, Brand
+from backend.models import Category, AdminUser, CustomerUser, Product, Cart, OrderItem, Order, Brand, Task, PickupSlot, \
+    OrderStatus, PriceRule, Wallet, WalletEntry, Outlet, OutletDailyRollup, \
+    ArchivedOrder
 
 from django.utils.html import format_html
 from django.db.models import Q
@@ -63,9 +65,16 @@ class BrandAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+@admin.register(Outlet)
+class OutletAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code', 'is_active')
+    search_fields = ('name', 'code')
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category','price','image_tag',)
+    list_display = ('name', 'outlet', 'category','price','image_tag',)
+    list_filter = ('outlet', 'category')
+    list_select_related = ('outlet', 'category')
 
     def image_tag(self, obj):
         return format_html('<img src = "{}" width = "150" height="150" />'.format(obj.image_path.url))
@@ -74,7 +83,9 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'custom_user', 'product', 'qty',)
+    list_display = ('id', 'custom_user', 'outlet', 'product', 'qty', 'updated_at')
+    list_filter = ('outlet',)
+    list_select_related = ('custom_user', 'outlet', 'product')
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -82,21 +93,139 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'customer', 'customer_phone','order_date', 'total_amount', 'order_status', 'payment_method', 'order_number')
-    list_filter = ('order_status', 'payment_method', 'order_date')
+    list_display = ('id', 'customer', 'customer_phone','order_date', 'total_amount', 'order_status', 'payment_method', 'pickup_slot', 'outlet', 'order_number')
+    # Outlet first: (outlet, order_status, order_date) is indexed
+    list_filter = ('outlet', 'order_status', 'payment_method', 'order_date', 'pickup_slot__date')
+    list_select_related = ('customer', 'pickup_slot', 'outlet')
     search_fields = ('order_number', 'customer__username')  # Assuming CustomUser has a username field
     readonly_fields = ('order_number', 'order_date')  # Fields that should be read-only
     inlines = [OrderItemInline]  # Display OrderItem as inline within Order admin
 
     list_display_links = ('id', 'customer', 'customer_phone', )
+    actions = ['approve_orders', 'reject_orders']
 
     def get_readonly_fields(self, request, obj=None):
         # Additional logic to determine read-only fields
         if obj:  # If editing an existing object
-            return self.readonly_fields + ('total_amount',)
+            readonly = self.readonly_fields + ('total_amount',)
+            # Only PENDING -> APPROVED/REJECTED is allowed, and only through transition()
+            if obj.order_status != OrderStatus.PENDING:
+                readonly += ('order_status',)
+            return readonly
         return self.readonly_fields
 
     def customer_phone(self, obj):
         return obj.customer.phone if obj.customer else "-"
 
-    customer_phone.short_description = 'Customer Phone'
\ No newline at end of file
+    customer_phone.short_description = 'Customer Phone'
+
+    def save_model(self, request, obj, form, change):
+        # Status changes made on the change form go through the same transition as the bulk actions
+        from backend.orders import transition
+
+        new_status = obj.order_status
+        if change and 'order_status' in form.changed_data and form.initial.get('order_status') == OrderStatus.PENDING:
+            obj.order_status = OrderStatus.PENDING
+            super().save_model(request, obj, form, change)
+            transition([obj.pk], new_status)
+            obj.order_status = new_status
+        else:
+            super().save_model(request, obj, form, change)
+
+    def _bulk_transition(self, request, queryset, to_status):
+        # Imported here so loading the admin does not pull in the order pipeline
+        from backend.orders import transition
+
+        changed = transition(queryset.values_list('id', flat=True), to_status)
+        skipped = queryset.count() - len(changed)
+        self.message_user(request, f"{len(changed)} order(s) marked {OrderStatus(to_status).label.lower()}.")
+        if skipped:
+            self.message_user(request, f"{skipped} order(s) were not pending and were skipped.", messages.WARNING)
+
+    @admin.action(description='Approve selected pending orders')
+    def approve_orders(self, request, queryset):
+        self._bulk_transition(request, queryset, OrderStatus.APPROVED)
+
+    @admin.action(description='Reject selected pending orders')
+    def reject_orders(self, request, queryset):
+        self._bulk_transition(request, queryset, OrderStatus.REJECTED)
+
+@admin.register(PriceRule)
+class PriceRuleAdmin(admin.ModelAdmin):
+    form = PriceRuleForm
+    list_display = ('name', 'kind', 'discount_percent', 'category', 'start_time', 'end_time', 'valid_from', 'valid_to', 'is_active')
+    list_filter = ('kind', 'is_active')
+    search_fields = ('name',)
+    filter_horizontal = ('products',)
+
+@admin.register(PickupSlot)
+class PickupSlotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'start_time', 'end_time', 'outlet', 'capacity', 'reserved')
+    list_filter = ('outlet', 'date')
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'idempotency_key')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(Wallet)
+class WalletAdmin(admin.ModelAdmin):
+    list_display = ('user', 'balance', 'checkpoint_balance', 'checkpointed_at', 'updated_at')
+    search_fields = ('user__email',)
+    list_select_related = ('user',)
+    # Balances only move through backend.wallet so they stay in step with the ledger
+    readonly_fields = ('user', 'balance', 'checkpoint_balance', 'checkpoint_entry_id', 'checkpointed_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(WalletEntry)
+class WalletEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'wallet', 'kind', 'amount', 'balance_after', 'order', 'reference', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('wallet__user__email', 'reference')
+    list_select_related = ('wallet__user', 'order')
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OutletDailyRollup)
+class OutletDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'outlet', 'orders', 'items', 'revenue')
+    list_filter = ('outlet',)
+    date_hierarchy = 'date'
+    list_select_related = ('outlet',)
+
+    # Maintained from approved orders; see `manage.py rebuild_rollups`
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('order_number', 'customer', 'outlet', 'order_date', 'total_amount', 'order_status')
+    list_filter = ('order_status', 'outlet')
+    list_select_related = ('customer', 'outlet')
+    # Exact match, so the search uses the unique index on order_number
+    search_fields = ('=order_number',)
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,4 +1,5 @@
-from backend.models import CustomUser
+from backend.models import CustomUser, PriceRule, PriceRuleKind
+from django import forms
 from django.contrib.auth.forms import UserCreationForm,UserChangeForm
 
 class CustomUserCreationForm(UserCreationForm):
@@ -9,4 +10,16 @@ class CustomUserCreationForm(UserCreationForm):
 class CustomUserChangeForm(UserChangeForm):
     class Meta:
         model = CustomUser
-        fields = ('email',)
\ No newline at end of file
+        fields = ('email',)
+
+class PriceRuleForm(forms.ModelForm):
+    class Meta:
+        model = PriceRule
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        products = cleaned_data.get('products')
+        if cleaned_data.get('kind') == PriceRuleKind.COMBO and (products is None or len(products) < 2):
+            self.add_error('products', 'A combo needs at least two products.')
+        return cleaned_data
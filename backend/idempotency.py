@@ -0,0 +1,89 @@
+"""
+Idempotency keys for POST endpoints such as place_order.
+
+The key row is inserted in the same transaction as the work it guards, so a
+retried or double-clicked request either sees the stored response or blocks on
+the unique constraint until the first one commits, and never runs twice.
+
+Only successful outcomes are stored. A 4xx result (slot full, wallet short...)
+rolls the key back with the rest of the transaction, so the user can fix the
+problem and submit the same form again.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from backend.models import IdempotencyKey
+
+BATCH_SIZE = 1000
+
+
+class _NotStored(Exception):
+    # Raised inside the transaction to roll back the key row with a failed pipeline
+    def __init__(self, status, body):
+        super().__init__(status)
+        self.status, self.body = status, body
+
+
+def get_key(request):
+    key = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+    return key.strip()[:64] if key else None
+
+
+def replay(user, key):
+    """The stored response for ``key``, or None if it has not been used yet."""
+    if not key:
+        return None
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        return None
+    return JsonResponse(record.response_body, status=record.response_status)
+
+
+def run_once(user, key, pipeline):
+    """
+    Call ``pipeline()`` (returning ``(status, body)``) at most once per key and
+    return its result as a JsonResponse. Error statuses are returned but not
+    stored, and everything the pipeline wrote is rolled back.
+    """
+    if not key:
+        status, body = pipeline()
+        return JsonResponse(body, status=status)
+
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, expires_at=timezone.now() + timedelta(seconds=ttl)
+            )
+            status, body = pipeline()
+            if status >= 400:
+                raise _NotStored(status, body)
+            record.response_status, record.response_body = status, body
+            record.save(update_fields=['response_status', 'response_body'])
+    except _NotStored as e:
+        return JsonResponse(e.body, status=e.status)
+    except IntegrityError:
+        # Another request with this key committed first; everything above rolled back
+        stored = replay(user, key)
+        if stored is None:
+            raise
+        return stored
+
+    return JsonResponse(record.response_body, status=record.response_status)
+
+
+def purge_expired():
+    """Delete expired keys in batches. Returns the number removed."""
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lt=timezone.now())
+            .values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
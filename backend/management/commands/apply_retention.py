@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from backend.retention import sweep_carts, archive_orders, prune_sequences
+
+
+class Command(BaseCommand):
+    help = 'Delete orphaned and stale carts and archive old orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cart-days', type=int, help='Override CART_RETENTION_DAYS')
+        parser.add_argument('--order-months', type=int, help='Override ORDER_RETENTION_MONTHS')
+        parser.add_argument('--carts-only', action='store_true', help='Only sweep carts')
+
+    def handle(self, *args, **options):
+        orphaned, stale = sweep_carts(options['cart_days'])
+        self.stdout.write(f"Removed {orphaned} orphaned and {stale} stale cart row(s)")
+        if options['carts_only']:
+            return
+
+        try:
+            archived = archive_orders(options['order_months'])
+        except IntegrityError as e:
+            # The failing batch was rolled back; its orders are still live
+            raise CommandError(f"Archiving stopped, an order number is already archived: {e}")
+        self.stdout.write(f"Archived {archived} order(s)")
+        self.stdout.write(f"Pruned {prune_sequences()} order number counter(s)")
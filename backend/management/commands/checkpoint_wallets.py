@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from backend.wallet import checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Reconcile wallet balances with the ledger and move their checkpoints forward'
+
+    def handle(self, *args, **options):
+        checkpointed, mismatched = checkpoint()
+        self.stdout.write(f"Checkpointed {checkpointed} wallet(s)")
+        if mismatched:
+            self.stderr.write(f"Balance mismatch in wallet(s): {', '.join(map(str, mismatched))}")
@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from backend.models import Outlet
+from backend.slots import create_slots
+
+
+class Command(BaseCommand):
+    help = 'Create pickup slots for a day, e.g. --start 11:00 --end 14:00 --minutes 15 --capacity 40'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='YYYY-MM-DD, defaults to today')
+        parser.add_argument('--days', type=int, default=1, help='Number of consecutive days')
+        parser.add_argument('--start', default='11:00')
+        parser.add_argument('--end', default='14:00')
+        parser.add_argument('--minutes', type=int, default=15)
+        parser.add_argument('--capacity', type=int, default=40)
+        parser.add_argument('--outlet', help='Outlet code; slots without one are offered at every outlet')
+
+    def handle(self, *args, **options):
+        try:
+            date = datetime.date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+            start = datetime.time.fromisoformat(options['start'])
+            end = datetime.time.fromisoformat(options['end'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        outlet = None
+        if options['outlet']:
+            outlet = Outlet.objects.filter(code=options['outlet'].lower()).first()
+            if outlet is None:
+                raise CommandError(f"Unknown outlet {options['outlet']}")
+
+        for offset in range(options['days']):
+            day = date + datetime.timedelta(days=offset)
+            count = create_slots(day, start, end, options['minutes'], options['capacity'], outlet)
+            self.stdout.write(f"{day}: {count} slot(s)")
@@ -0,0 +1,25 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.wallet import import_topups
+
+
+class Command(BaseCommand):
+    help = 'Credit wallets in bulk from a CSV file with email,amount,reference columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as f:
+                rows = [
+                    (row.get('email', ''), row.get('amount', ''), row.get('reference', ''))
+                    for row in csv.DictReader(f)
+                ]
+        except OSError as e:
+            raise CommandError(e)
+
+        imported, skipped = import_topups(rows)
+        self.stdout.write(f"Imported {imported} top-up(s), skipped {skipped}")
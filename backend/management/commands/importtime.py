@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = ('web', 'worker', 'test', 'bench')
+
+
+class Command(BaseCommand):
+    help = 'Summarise `python -X importtime` for a cold start under a settings profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=PROFILES, default='worker')
+        parser.add_argument('--urls', action='store_true', help='Also load the URLconf, as the first web request does')
+        parser.add_argument('--top', type=int, default=15, help='Rows to show per table')
+        parser.add_argument('--max-ms', type=float, help='Exit with an error if the total is above this')
+
+    def handle(self, *args, **options):
+        code = 'import django; django.setup()'
+        if options['urls']:
+            code += '; from django.urls import get_resolver; get_resolver().url_patterns'
+
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=f"config.settings.{options['profile']}")
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'Import failed')
+
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            depth = len(name) - len(name.lstrip())
+            modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        if not modules:
+            raise CommandError('No -X importtime output was captured')
+
+        # Top-level imports are the least indented lines; their cumulative times add up to the total
+        top_depth = min(depth for _, _, _, depth in modules)
+        total_ms = sum(cumulative for _, _, cumulative, depth in modules if depth == top_depth) / 1000
+
+        by_package = defaultdict(int)
+        for name, self_us, _, _ in modules:
+            by_package[name.split('.')[0]] += self_us
+
+        self.stdout.write(f"Profile: {options['profile']}{' + urls' if options['urls'] else ''}")
+        self.stdout.write(f"Total: {total_ms:.1f} ms over {len(modules)} modules\n")
+
+        self.stdout.write('By package (self time):')
+        for package, self_us in sorted(by_package.items(), key=lambda row: -row[1])[:options['top']]:
+            self.stdout.write(f"  {self_us / 1000:8.1f} ms  {package}")
+
+        self.stdout.write('\nSlowest modules (self time):')
+        for name, self_us, _, _ in sorted(modules, key=lambda row: -row[1])[:options['top']]:
+            self.stdout.write(f"  {self_us / 1000:8.1f} ms  {name}")
+
+        if options['max_ms'] is not None and total_ms > options['max_ms']:
+            raise CommandError(f"Import time {total_ms:.1f} ms is over the {options['max_ms']:.1f} ms budget")
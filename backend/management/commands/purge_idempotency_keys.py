@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from backend.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete checkout idempotency keys past their TTL'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Removed {purge_expired()} expired key(s)")
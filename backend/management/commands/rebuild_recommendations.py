@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.recommendations import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute favourites and bought-together pairs from the order history'
+
+    def handle(self, *args, **options):
+        stats, pairs = rebuild()
+        self.stdout.write(f"Rebuilt {stats} customer stat(s) and {pairs} product pair(s)")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from backend.outlets import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-outlet daily rollups from approved orders'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rebuilt {rebuild_rollups()} rollup row(s)")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.tasks import run_pending, queue_depth
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (order emails, receipts, ...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due tasks once and exit')
+        parser.add_argument('--batch', type=int, default=100, help='Tasks fetched per poll')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for key, value in queue_depth().items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        while True:
+            processed = run_pending(batch_size=options['batch'])
+            if processed:
+                self.stdout.write(f"Processed {processed} task(s)")
+            if options['once']:
+                if processed < options['batch']:
+                    break
+                continue
+            if not processed:
+                time.sleep(options['sleep'])
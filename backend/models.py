@@ -1,8 +1,12 @@
 import datetime
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from .manager import CustomUserManager
 
 class Gender(models.TextChoices):
@@ -87,9 +91,41 @@ class Brand(models.Model):
     class Meta:
         db_table='brand'
 
+# Outlets (canteen counters) partition the catalog, carts and orders. An outlet
+# is retired with is_active; one with products or orders cannot be deleted,
+# since a NULL outlet would make them shared by every counter
+class Outlet(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=255)
+    # Short code, also used (upper-cased) as the order number prefix; stored
+    # lower-case so 'main' and 'MAIN' cannot both exist and share a prefix
+    code = models.SlugField(max_length=5, unique=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        # Before validate_unique, so the admin reports a clash instead of failing on save
+        self.code = self.code.lower()
+
+    def save(self, *args, **kwargs):
+        self.code = self.code.lower()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        db_table = 'outlet'
+        ordering = ('name',)
+        constraints = [
+            # Also holds for writes that skip save(), e.g. queryset.update()
+            models.UniqueConstraint(Lower('code'), name='outlet_code_ci_unique'),
+        ]
+
 class Product(models.Model):
     id = models.BigAutoField(primary_key=True)
 
+    outlet = models.ForeignKey(Outlet, null=True, blank=True, on_delete=models.PROTECT, related_name='products')
+
     name = models.CharField(max_length=255)
 
     category=models.ForeignKey(Category,null=True,blank=True,on_delete=models.SET_NULL, related_name='products')
@@ -109,12 +145,19 @@ class Product(models.Model):
 
     class Meta:
         db_table = 'product'
+        indexes = [
+            # Each counter's catalog page only reads its own products
+            models.Index(fields=['outlet', 'category'], name='product_outlet_category_idx'),
+        ]
 
 class Cart(models.Model):
     id = models.BigAutoField(primary_key=True)
     custom_user = models.ForeignKey(CustomUser,on_delete=models.SET_NULL,blank=True,null=True)
     product =  models.ForeignKey(Product,on_delete=models.SET_NULL,blank=True,null=True)
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, blank=True, null=True)
     qty = models.IntegerField()
+    # Abandoned carts are swept by backend.retention
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return str(self.qty)
@@ -123,13 +166,89 @@ class Cart(models.Model):
         return self.qty * self.product.price if self.product else 0
 
     @classmethod
-    def grand_total(cls, customer_id):
-        cart_items = cls.objects.filter(custom_user_id=customer_id)
-        total = sum(item.total_price() for item in cart_items)
-        return total
+    def for_user(cls, user, outlet=None):
+        # A customer has one cart per outlet; rows without an outlet (added
+        # before outlets existed) show up in every one of them
+        cart_items = cls.objects.filter(custom_user=user)
+        if outlet is not None:
+            cart_items = cart_items.filter(models.Q(outlet=outlet) | models.Q(outlet__isnull=True))
+        return cart_items
+
+    @classmethod
+    def grand_total(cls, customer_id, staff=False, outlet=None):
+        # Discounted total from the compiled price table (backend.pricing)
+        from backend.pricing import quote
+
+        cart_items = cls.for_user(customer_id, outlet)
+        return quote(cart_items, staff=staff).total
+
+    @classmethod
+    def add_products(cls, user, quantities, outlet=None):
+        """Add {product_id: qty} to the user's cart, merging with rows already there."""
+        quantities = dict(quantities)
+        existing = list(cls.for_user(user, outlet).filter(product_id__in=quantities))
+        now = timezone.now()
+        for item in existing:
+            item.qty += quantities.pop(item.product_id)
+            item.updated_at = now
+        with transaction.atomic():
+            # bulk_update() skips auto_now, so updated_at is set above
+            cls.objects.bulk_update(existing, ['qty', 'updated_at'])
+            cls.objects.bulk_create([
+                cls(custom_user=user, product_id=product_id, outlet=outlet, qty=qty)
+                for product_id, qty in quantities.items()
+            ])
 
     class Meta:
         db_table = 'cart'
+        indexes = [
+            models.Index(fields=['custom_user', 'outlet'], name='cart_user_outlet_idx'),
+        ]
+
+# Pricing rules (compiled into a price table by backend.pricing)
+class PriceRuleKind(models.TextChoices):
+    COMBO = 'COMBO',_('Combo')
+    TIME_OF_DAY = 'TIME_OF_DAY',_('Time of day special')
+    CATEGORY = 'CATEGORY',_('Category discount')
+    STAFF = 'STAFF',_('Staff pricing')
+
+class PriceRule(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=20, choices=PriceRuleKind.choices)
+    discount_percent = models.PositiveSmallIntegerField()
+    # Combos need all of these in the cart; other kinds apply to these products,
+    # else to the category, else to every product
+    products = models.ManyToManyField(Product, blank=True, related_name='price_rules')
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.CASCADE, related_name='price_rules')
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    valid_from = models.DateField(null=True, blank=True)
+    valid_to = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.discount_percent}%)"
+
+    def clean(self):
+        # A rule missing its target would otherwise discount every product at all hours.
+        # Combo products are many-to-many and are checked by PriceRuleForm.
+        errors = {}
+        if self.discount_percent is not None and self.discount_percent > 100:
+            errors['discount_percent'] = _('A discount cannot exceed 100%.')
+        if self.kind == PriceRuleKind.CATEGORY and not self.category_id:
+            errors['category'] = _('A category discount needs a category.')
+        if self.kind == PriceRuleKind.TIME_OF_DAY and not (self.start_time and self.end_time):
+            errors['start_time'] = _('A time of day special needs a start and an end time.')
+        elif bool(self.start_time) != bool(self.end_time):
+            errors['end_time'] = _('Set both start and end time, or neither.')
+        if self.valid_from and self.valid_to and self.valid_from > self.valid_to:
+            errors['valid_to'] = _('The rule ends before it starts.')
+        if errors:
+            raise ValidationError(errors)
+
+    class Meta:
+        db_table = 'price_rule'
 
 # Order
 class OrderStatus(models.TextChoices):
@@ -141,11 +260,78 @@ class PaymentMethodStatus(models.TextChoices):
     CASH = 'CASH',_('CASH')
     UPI = 'UPI',_('UPI')
     CARD = 'CARD',_('CARD')
+    WALLET = 'WALLET',_('WALLET')
+
+# Pickup slots (see backend.slots)
+class PickupSlot(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, blank=True, null=True, related_name='pickup_slots')
+    date = models.DateField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    capacity = models.IntegerField()
+    # Counter bumped atomically at checkout so availability never counts orders
+    reserved = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.start_time.strftime('%H:%M')}-{self.end_time.strftime('%H:%M')}"
+
+    @property
+    def remaining(self):
+        return max(self.capacity - self.reserved, 0)
+
+    class Meta:
+        db_table = 'pickup_slot'
+        ordering = ('date', 'start_time')
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'date', 'start_time'], name='pickup_slot_unique'),
+            # NULLs never collide in a unique index, so slots without an outlet need their own
+            models.UniqueConstraint(
+                fields=['date', 'start_time'], condition=models.Q(outlet__isnull=True),
+                name='pickup_slot_no_outlet_unique',
+            ),
+        ]
+
+class OrderSequence(models.Model):
+    # Last order number handed out per outlet and day, so numbering never scans orders
+    id = models.BigAutoField(primary_key=True)
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, blank=True, null=True)
+    date = models.DateField()
+    last_number = models.IntegerField(default=0)
+
+    @classmethod
+    def next_number(cls, outlet_id, date, seed=lambda: 0):
+        """
+        Allocate the next number. The counter row stays locked until the caller's
+        transaction ends, and a rollback gives the number back.
+        """
+        sequence = cls.objects.filter(outlet_id=outlet_id, date=date)
+        with transaction.atomic():
+            if not sequence.exists():
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(outlet_id=outlet_id, date=date, last_number=seed())
+                except IntegrityError:
+                    # Another checkout created it first
+                    pass
+            sequence.update(last_number=F('last_number') + 1)
+            return sequence.values_list('last_number', flat=True).get()
+
+    class Meta:
+        db_table = 'order_sequence'
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'date'], name='order_sequence_unique'),
+            models.UniqueConstraint(
+                fields=['date'], condition=models.Q(outlet__isnull=True),
+                name='order_sequence_no_outlet_unique',
+            ),
+        ]
 
 class Order(models.Model):
     id = models.BigAutoField(primary_key=True)
     customer = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, blank=True, null=True)
-    order_number = models.CharField(max_length=20, unique=True, blank=True)
+    # '<OUTLET> YYYY-MM-DD NNN': room for a 5-letter outlet code and a counter past 999
+    order_number = models.CharField(max_length=32, unique=True, blank=True)
     order_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     order_status = models.CharField(
@@ -158,6 +344,8 @@ class Order(models.Model):
         choices=PaymentMethodStatus.choices,
         default=PaymentMethodStatus.CASH
     )
+    pickup_slot = models.ForeignKey(PickupSlot, on_delete=models.SET_NULL, blank=True, null=True, related_name='orders')
+    outlet = models.ForeignKey(Outlet, on_delete=models.PROTECT, blank=True, null=True, related_name='orders')
 
 
     def save(self, *args, **kwargs):
@@ -166,20 +354,37 @@ class Order(models.Model):
         super().save(*args, **kwargs)
 
     def generate_order_number(self):
-        today = datetime.date.today().strftime('%Y-%m-%d')
-        last_order = Order.objects.filter(order_date__date=today).order_by('-id').first()
+        today = datetime.date.today()
+        next_number = OrderSequence.next_number(self.outlet_id, today, seed=lambda: self._last_number_on(today))
+        prefix = f"{self.outlet.code.upper()} " if self.outlet_id else ''
+        return f"{prefix}{today.strftime('%Y-%m-%d')} {str(next_number).zfill(3)}"
+
+    def _last_number_on(self, day):
+        # Only used to seed a day's counter for orders numbered before OrderSequence existed
+        last_order = Order.objects.filter(order_date__date=day, outlet_id=self.outlet_id).order_by('-id').first()
         if last_order:
-            last_number = int(last_order.order_number.split()[-1])
-            next_number = str(last_number + 1).zfill(3)
-        else:
-            next_number = '001'
-        return f"{today} {next_number}"
+            try:
+                return int(last_order.order_number.split()[-1])
+            except ValueError:
+                pass
+        return 0
 
     def __str__(self):
         return f"{self.order_date.strftime('%d-%m-%Y %H:%M:%S')} {self.customer} {self.total_amount}"
 
     class Meta:
         db_table = 'order'
+        indexes = [
+            # "My orders" keyset pagination; on PostgreSQL the listed columns are
+            # included so the history page is served from the index alone
+            models.Index(
+                fields=['customer', '-order_date', '-id'],
+                name='order_customer_date_idx',
+                include=['order_number', 'total_amount', 'order_status'],
+            ),
+            # Kitchen view and OrderAdmin filter one counter's orders by status
+            models.Index(fields=['outlet', 'order_status', 'order_date'], name='order_outlet_status_idx'),
+        ]
 
 # OrderItem
 class OrderItem(models.Model):
@@ -199,4 +404,219 @@ class OrderItem(models.Model):
         return f"{self.order} {self.product.name} {self.qty} {self.unit_price} {self.amount}"
 
     class Meta:
-        db_table = 'order_items'
\ No newline at end of file
+        db_table = 'order_items'
+
+# Task queue
+class TaskStatus(models.TextChoices):
+    QUEUED = 'QUEUED',_('Queued')
+    RUNNING = 'RUNNING',_('Running')
+    DONE = 'DONE',_('Done')
+    FAILED = 'FAILED',_('Failed')
+
+class Task(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    # Dotted path of the handler, e.g. 'backend.tasks.send_order_confirmation'
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    # Enqueueing the same key twice is a no-op, so retried requests never duplicate side effects
+    idempotency_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=TaskStatus.choices, default=TaskStatus.QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} {self.status} ({self.attempts}/{self.max_attempts})"
+
+    class Meta:
+        db_table = 'task'
+        indexes = [
+            # The worker polls "QUEUED and due", oldest first
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+
+# Recommendations (kept up to date by backend.recommendations)
+class CustomerProductStat(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    customer = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='product_stats')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='customer_stats')
+    times_ordered = models.IntegerField(default=0)
+    qty_total = models.IntegerField(default=0)
+    last_ordered = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.customer} {self.product} x{self.times_ordered}"
+
+    class Meta:
+        db_table = 'customer_product_stat'
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'product'], name='customer_product_stat_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['customer', '-times_ordered'], name='customer_product_stat_top_idx'),
+        ]
+
+class ProductPair(models.Model):
+    # Stored in both directions so "bought together with X" is a single index lookup
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    paired_product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    times_together = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.product} + {self.paired_product} x{self.times_together}"
+
+    class Meta:
+        db_table = 'product_pair'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'paired_product'], name='product_pair_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-times_together'], name='product_pair_top_idx'),
+        ]
+
+
+# Idempotent checkout (see backend.idempotency)
+class IdempotencyKey(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=64)
+    response_status = models.IntegerField(default=200)
+    response_body = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user} {self.key}"
+
+    class Meta:
+        db_table = 'idempotency_key'
+        constraints = [
+            # Two requests racing on the same key cannot both commit
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_unique'),
+        ]
+
+
+# Prepaid wallet (see backend.wallet)
+class WalletEntryKind(models.TextChoices):
+    TOPUP = 'TOPUP',_('Top-up')
+    DEBIT = 'DEBIT',_('Debit')
+    REFUND = 'REFUND',_('Refund')
+
+class Wallet(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    user = models.OneToOneField(CustomUser, on_delete=models.PROTECT, related_name='wallet')
+    # Running balance, moved in the same transaction as every ledger entry
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # Ledger position last reconciled by `manage.py checkpoint_wallets`
+    checkpoint_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    checkpoint_entry_id = models.BigIntegerField(default=0)
+    checkpointed_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} {self.balance}"
+
+    class Meta:
+        db_table = 'wallet'
+
+class WalletEntry(models.Model):
+    # Append-only: entries are never updated or deleted, corrections are new entries
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='entries')
+    kind = models.CharField(max_length=20, choices=WalletEntryKind.choices)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=10, decimal_places=2)
+    # PROTECT: deleting the order would rewrite the ledger; retention skips these orders
+    order = models.ForeignKey(Order, on_delete=models.PROTECT, blank=True, null=True, related_name='wallet_entries')
+    # Gateway charge id or import reference; unique so nothing is credited twice
+    reference = models.CharField(max_length=100, unique=True, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Wallet entries are append-only.')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError('Wallet entries are append-only.')
+
+    def __str__(self):
+        return f"{self.wallet.user} {self.kind} {self.amount}"
+
+    class Meta:
+        db_table = 'wallet_entry'
+        indexes = [
+            models.Index(fields=['wallet', '-id'], name='wallet_entry_recent_idx'),
+        ]
+
+
+# Receipts (see backend.receipts)
+class Receipt(models.Model):
+    # Rendered once when the order is approved and never changed afterwards
+    id = models.BigAutoField(primary_key=True)
+    order_number = models.CharField(max_length=32, unique=True)
+    customer = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Receipts are immutable.')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.order_number
+
+    class Meta:
+        db_table = 'receipt'
+
+
+# Per-outlet daily totals, kept up to date as orders are approved
+class OutletDailyRollup(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, blank=True, null=True, related_name='rollups')
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    items = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.outlet or '-'} {self.date} {self.revenue}"
+
+    class Meta:
+        db_table = 'outlet_daily_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'date'], name='outlet_daily_rollup_unique'),
+            models.UniqueConstraint(
+                fields=['date'], condition=models.Q(outlet__isnull=True),
+                name='outlet_daily_rollup_no_outlet_unique',
+            ),
+        ]
+
+
+# Orders moved out of the order/order_items tables by backend.retention
+class ArchivedOrder(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    # Unique, so looking an archived order up by number is an index lookup
+    order_number = models.CharField(max_length=32, unique=True)
+    customer = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    outlet = models.ForeignKey(Outlet, on_delete=models.PROTECT, blank=True, null=True, related_name='+')
+    order_date = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    order_status = models.CharField(max_length=255, choices=OrderStatus.choices)
+    payment_method = models.CharField(max_length=255, choices=PaymentMethodStatus.choices)
+    item_count = models.IntegerField(default=0)
+    # Items, pickup slot and anything else needed to show the order again
+    data = models.JSONField(default=dict)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.order_number
+
+    class Meta:
+        db_table = 'archived_order'
@@ -0,0 +1,43 @@
+"""
+Order status transitions.
+
+Status changes go through ``transition()`` so many orders can be moved with a
+single guarded UPDATE and the rest of the system (stock, pickup slots,
+notifications) hears about the whole batch through one
+``order_status_changed`` signal.
+"""
+from django.db import transaction
+
+from backend.models import Order, OrderStatus
+from backend.signals import order_status_changed
+
+# Which states an order may move to from each state
+ALLOWED_TRANSITIONS = {
+    OrderStatus.PENDING: (OrderStatus.APPROVED, OrderStatus.REJECTED),
+}
+
+
+def transition(order_ids, to_status, from_status=OrderStatus.PENDING):
+    """
+    Move the given orders from ``from_status`` to ``to_status``.
+
+    Orders that are not currently in ``from_status`` are left alone. Returns the
+    ids that actually changed.
+    """
+    if to_status not in ALLOWED_TRANSITIONS.get(from_status, ()):
+        raise ValueError(f"Cannot move orders from {from_status} to {to_status}")
+
+    with transaction.atomic():
+        candidates = Order.objects.select_for_update().filter(id__in=order_ids, order_status=from_status)
+        changed = list(candidates.values_list('id', flat=True))
+        if not changed:
+            return []
+
+        # The status guard is repeated so a concurrent change is never overwritten
+        Order.objects.filter(id__in=changed, order_status=from_status).update(order_status=to_status)
+
+        order_status_changed.send(
+            sender=Order, order_ids=changed, from_status=from_status, to_status=to_status
+        )
+
+    return changed
@@ -0,0 +1,124 @@
+"""
+Outlets (canteen counters).
+
+The active outlets are cached as a small list, and the outlet a customer is
+ordering from is kept in their session. Deployments without any Outlet rows
+keep working unscoped: ``current_outlet()`` returns None and every query
+falls back to the whole catalog. Products, cart rows and pickup slots without
+an outlet are shared by all outlets, so adding the first outlet does not hide
+anything created before it.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from backend.models import Outlet, Order, OrderItem, OrderStatus, OutletDailyRollup, ArchivedOrder
+
+CACHE_KEY = 'outlets:active'
+# Saving an outlet drops the shared entry (backend.signals); the timeout bounds
+# staleness if a process ever runs with a cache of its own
+CACHE_TIMEOUT = 60 * 5
+SESSION_KEY = 'outlet_id'
+
+
+def active_outlets():
+    outlets = cache.get(CACHE_KEY)
+    if outlets is None:
+        outlets = list(Outlet.objects.filter(is_active=True).values('id', 'code', 'name'))
+        cache.set(CACHE_KEY, outlets, CACHE_TIMEOUT)
+    return outlets
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
+
+
+def current_outlet(request):
+    """The outlet chosen in this session, else the first active one, else None."""
+    outlets = active_outlets()
+    if not outlets:
+        return None
+    chosen = request.session.get(SESSION_KEY)
+    data = next((outlet for outlet in outlets if outlet['id'] == chosen), outlets[0])
+    # Built from the cached values; good for filtering and assigning, not for saving
+    return Outlet(is_active=True, **data)
+
+
+def select_outlet(request, code):
+    code = code.lower()
+    outlet = next((outlet for outlet in active_outlets() if outlet['code'] == code), None)
+    if outlet is not None:
+        request.session[SESSION_KEY] = outlet['id']
+    return outlet
+
+
+def _approved_totals(orders):
+    # (outlet_id, day) -> [orders, items, revenue] for approved ``orders``
+    totals = {}
+    grouped = (
+        orders.annotate(day=TruncDate('order_date'))
+        .values('outlet_id', 'day')
+        .annotate(count=Count('id'), revenue=Sum('total_amount'))
+        .order_by()
+    )
+    for row in grouped:
+        totals[(row['outlet_id'], row['day'])] = [row['count'], 0, row['revenue'] or 0]
+
+    items = (
+        OrderItem.objects.filter(order__in=orders)
+        .annotate(day=TruncDate('order__order_date'))
+        .values('order__outlet_id', 'day')
+        .annotate(qty=Sum('qty'))
+        .order_by()
+    )
+    for row in items:
+        key = (row['order__outlet_id'], row['day'])
+        if key in totals:
+            totals[key][1] = row['qty'] or 0
+    return totals
+
+
+def record_approved(order_ids):
+    """Add a batch of just-approved orders to the daily rollups."""
+    totals = _approved_totals(Order.objects.filter(id__in=order_ids, order_status=OrderStatus.APPROVED))
+    if not totals:
+        return
+
+    OutletDailyRollup.objects.bulk_create(
+        [OutletDailyRollup(outlet_id=outlet_id, date=day) for outlet_id, day in totals],
+        ignore_conflicts=True,
+    )
+    for (outlet_id, day), (count, items, revenue) in totals.items():
+        OutletDailyRollup.objects.filter(outlet_id=outlet_id, date=day).update(
+            orders=F('orders') + count,
+            items=F('items') + items,
+            revenue=F('revenue') + revenue,
+        )
+
+
+def _archived_totals(totals):
+    # Archived orders no longer have order_items rows; their item count is stored
+    grouped = (
+        ArchivedOrder.objects.filter(order_status=OrderStatus.APPROVED)
+        .annotate(day=TruncDate('order_date'))
+        .values('outlet_id', 'day')
+        .annotate(count=Count('id'), items=Sum('item_count'), revenue=Sum('total_amount'))
+        .order_by()
+    )
+    for row in grouped:
+        current = totals.setdefault((row['outlet_id'], row['day']), [0, 0, 0])
+        current[0] += row['count']
+        current[1] += row['items'] or 0
+        current[2] += row['revenue'] or 0
+    return totals
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the approved orders, live and archived (backfill / repair)."""
+    totals = _archived_totals(_approved_totals(Order.objects.filter(order_status=OrderStatus.APPROVED)))
+    OutletDailyRollup.objects.all().delete()
+    OutletDailyRollup.objects.bulk_create([
+        OutletDailyRollup(outlet_id=outlet_id, date=day, orders=count, items=items, revenue=revenue)
+        for (outlet_id, day), (count, items, revenue) in totals.items()
+    ])
+    return len(totals)
@@ -0,0 +1,32 @@
+"""
+Payment gateway used for wallet top-ups.
+
+``PAYMENT_GATEWAY`` names the class to use. ``FakeGateway`` approves every
+charge locally and is what development and the tests run against.
+"""
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PaymentError(Exception):
+    pass
+
+
+class FakeGateway:
+    # Sources that the fake gateway declines, for exercising failure paths
+    DECLINED = ('decline', 'tok_decline')
+
+    def charge(self, amount, source):
+        """Charge ``amount`` to ``source`` and return the gateway's charge id."""
+        if Decimal(amount) <= 0:
+            raise PaymentError('Amount must be positive.')
+        if source in self.DECLINED:
+            raise PaymentError('Card declined.')
+        return f"fake_{uuid.uuid4().hex}"
+
+
+def get_gateway():
+    return import_string(getattr(settings, 'PAYMENT_GATEWAY', 'backend.payments.FakeGateway'))()
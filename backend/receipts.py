@@ -0,0 +1,90 @@
+"""
+Receipts.
+
+A receipt is rendered once, when its order is approved, and stored as an
+immutable Receipt row keyed by order number. Viewing it afterwards is a cache
+or single-row lookup and never joins order_items and product again.
+"""
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from backend.models import Order, OrderItem, OrderStatus, Receipt
+
+WIDTH = 40
+# Receipts never change, so cached copies never need invalidating
+CACHE_TIMEOUT = None
+
+
+def _cache_key(order_number):
+    return f"receipt:{order_number.replace(' ', '_')}"
+
+
+def _money(value):
+    return f"Rs {value:.2f}"
+
+
+def render(order):
+    """Plain-text receipt for ``order`` with its items prefetched."""
+    lines = [
+        'College Canteen'.center(WIDTH),
+        'RECEIPT'.center(WIDTH),
+        '=' * WIDTH,
+        f"Order:   {order.order_number}",
+        f"Date:    {order.order_date.strftime('%d-%m-%Y %H:%M')}",
+        f"Payment: {order.get_payment_method_display()}",
+    ]
+    if order.pickup_slot_id:
+        lines.append(f"Pickup:  {order.pickup_slot}")
+    lines.append('-' * WIDTH)
+
+    for item in order.order_items.all():
+        name = item.product.name if item.product else 'Unavailable item'
+        lines.append(name[:WIDTH])
+        detail = f"  {item.qty} x {_money(item.unit_price)}"
+        if item.discount:
+            detail += f" -{item.discount}%"
+        lines.append(detail + _money(item.amount).rjust(WIDTH - len(detail)))
+
+    total = 'TOTAL'
+    lines += [
+        '-' * WIDTH,
+        total + _money(order.total_amount or 0).rjust(WIDTH - len(total)),
+        '=' * WIDTH,
+        'Thank you!'.center(WIDTH),
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _orders(order_ids):
+    return (
+        Order.objects.filter(id__in=order_ids, order_status=OrderStatus.APPROVED)
+        .select_related('pickup_slot')
+        .prefetch_related(Prefetch('order_items', queryset=OrderItem.objects.select_related('product')))
+    )
+
+
+def render_receipts(order_ids):
+    """Store receipts for approved orders. Enqueued once per approved batch."""
+    receipts = [
+        Receipt(order_number=order.order_number, customer_id=order.customer_id, content=render(order))
+        for order in _orders(order_ids)
+    ]
+    # Orders that already have a receipt keep the original
+    Receipt.objects.bulk_create(receipts, ignore_conflicts=True)
+    return len(receipts)
+
+
+def get_receipt(order_number):
+    """The stored receipt, rendering it now if the background task has not run yet."""
+    key = _cache_key(order_number)
+    receipt = cache.get(key)
+    if receipt is None:
+        receipt = Receipt.objects.filter(order_number=order_number).first()
+        if receipt is None:
+            order = _orders(Order.objects.filter(order_number=order_number).values('id')).first()
+            if order is None:
+                return None
+            render_receipts([order.id])
+            receipt = Receipt.objects.get(order_number=order_number)
+        cache.set(key, receipt, CACHE_TIMEOUT)
+    return receipt
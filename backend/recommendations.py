@@ -0,0 +1,179 @@
+"""
+Per-customer favourites and "frequently bought together" pairs.
+
+The counters in CustomerProductStat / ProductPair are bumped once per placed
+order (``record_order`` runs as a background task), and the pages read small
+cached lists built from them instead of aggregating OrderItem history: each
+customer's favourites (``get_recommendations``) and, shared by everyone, the
+products most often bought with each product (``paired_with``).
+"""
+import time
+from collections import Counter
+from itertools import groupby, permutations
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Sum, Value, When
+
+from backend.models import CustomerProductStat, ProductPair, OrderItem, Order
+
+TOP_ITEMS = 8
+PAIRS_PER_ITEM = 3
+CACHE_TIMEOUT = 60 * 60 * 24
+BATCH_SIZE = 1000
+
+
+def _generation():
+    # Bumped by rebuild() to drop every cached entry at once
+    return cache.get_or_set('recs:generation', 1, None)
+
+
+def _cache_key(customer_id):
+    return f"recs:{_generation()}:{customer_id}"
+
+
+def _pairs_key(generation, product_id):
+    return f"recs:{generation}:pairs:{product_id}"
+
+
+def record_order(order_id):
+    """Fold one order into the counters. Enqueued by place_order."""
+    order = Order.objects.get(pk=order_id)
+    quantities = dict(
+        OrderItem.objects.filter(order_id=order_id, product__isnull=False)
+        .values_list('product_id')
+        .annotate(qty=Sum('qty'))
+    )
+    if not quantities or not order.customer_id:
+        return
+
+    product_ids = list(quantities)
+    with transaction.atomic():
+        # Make sure every counter row exists, then bump them all in one UPDATE
+        CustomerProductStat.objects.bulk_create(
+            [CustomerProductStat(customer_id=order.customer_id, product_id=pid) for pid in product_ids],
+            ignore_conflicts=True,
+        )
+        CustomerProductStat.objects.filter(
+            customer_id=order.customer_id, product_id__in=product_ids
+        ).update(
+            times_ordered=F('times_ordered') + 1,
+            qty_total=F('qty_total') + Case(
+                *[When(product_id=pid, then=Value(qty)) for pid, qty in quantities.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            last_ordered=order.order_date,
+        )
+
+        if len(product_ids) > 1:
+            ProductPair.objects.bulk_create(
+                [ProductPair(product_id=a, paired_product_id=b) for a, b in permutations(product_ids, 2)],
+                ignore_conflicts=True,
+            )
+            ProductPair.objects.filter(
+                product_id__in=product_ids, paired_product_id__in=product_ids
+            ).exclude(product_id=F('paired_product_id')).update(times_together=F('times_together') + 1)
+
+    generation = _generation()
+    cache.delete_many([_cache_key(order.customer_id)] + [_pairs_key(generation, pid) for pid in product_ids])
+
+
+def _build(customer_id):
+    top = list(
+        CustomerProductStat.objects.filter(customer_id=customer_id)
+        .order_by('-times_ordered', '-last_ordered')
+        .values_list('product_id', flat=True)[:TOP_ITEMS]
+    )
+    return {'top': top}
+
+
+def get_recommendations(customer_id):
+    key = _cache_key(customer_id)
+    data = cache.get(key)
+    if data is None:
+        data = _build(customer_id)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def paired_with(product_ids):
+    """``{product_id: [paired_id, ...]}``, most often bought together first, cached per product."""
+    generation = _generation()
+    keys = {_pairs_key(generation, product_id): product_id for product_id in set(product_ids)}
+    cached = cache.get_many(keys)
+    together = {keys[key]: paired for key, paired in cached.items()}
+
+    missing = [product_id for key, product_id in keys.items() if key not in cached]
+    if missing:
+        loaded = {product_id: [] for product_id in missing}
+        pairs = (
+            ProductPair.objects.filter(product_id__in=missing)
+            .order_by('product_id', '-times_together')
+            .values_list('product_id', 'paired_product_id')
+        )
+        for product_id, rows in groupby(pairs, key=lambda row: row[0]):
+            loaded[product_id] = [paired for _, paired in rows][:PAIRS_PER_ITEM]
+        # Products with no pairs are cached too, as an empty list
+        cache.set_many({_pairs_key(generation, pid): paired for pid, paired in loaded.items()}, CACHE_TIMEOUT)
+        together.update(loaded)
+    return together
+
+
+def suggestions_for(product_ids, limit=4):
+    """Products often bought with ``product_ids`` that are not already among them."""
+    product_ids = [product_id for product_id in product_ids if product_id is not None]
+    together = paired_with(product_ids)
+    suggested = []
+    for product_id in dict.fromkeys(product_ids):
+        for paired in together.get(product_id, []):
+            if paired not in product_ids and paired not in suggested:
+                suggested.append(paired)
+    return suggested[:limit]
+
+
+def rebuild():
+    """Recompute every counter from OrderItem history (backfill / repair)."""
+    with transaction.atomic():
+        CustomerProductStat.objects.all().delete()
+        ProductPair.objects.all().delete()
+
+        stats = (
+            OrderItem.objects.filter(product__isnull=False, order__customer__isnull=False)
+            .values('order__customer_id', 'product_id')
+            .annotate(times=Count('order', distinct=True), qty=Sum('qty'), last=Max('order__order_date'))
+        )
+        CustomerProductStat.objects.bulk_create(
+            (
+                CustomerProductStat(
+                    customer_id=row['order__customer_id'],
+                    product_id=row['product_id'],
+                    times_ordered=row['times'],
+                    qty_total=row['qty'],
+                    last_ordered=row['last'],
+                )
+                for row in stats.iterator()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+        pair_counts = Counter()
+        rows = (
+            OrderItem.objects.filter(product__isnull=False)
+            .order_by('order_id')
+            .values_list('order_id', 'product_id')
+            .distinct()
+        )
+        for _, items in groupby(rows.iterator(), key=lambda row: row[0]):
+            pair_counts.update(permutations([product_id for _, product_id in items], 2))
+        ProductPair.objects.bulk_create(
+            (
+                ProductPair(product_id=a, paired_product_id=b, times_together=count)
+                for (a, b), count in pair_counts.items()
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+    cache.set('recs:generation', time.time_ns(), None)
+
+    return CustomerProductStat.objects.count(), len(pair_counts)
@@ -0,0 +1,130 @@
+"""
+Data retention.
+
+Carts whose user or product has been deleted (``SET_NULL`` leaves them
+behind) and carts nobody has touched for ``CART_RETENTION_DAYS`` are deleted.
+Approved and rejected orders older than ``ORDER_RETENTION_MONTHS`` are copied
+into the ArchivedOrder table, items and all, and removed from order /
+order_items. Their daily totals stay in OutletDailyRollup and approved orders
+keep their Receipt, so reports and receipts are unaffected. Archived orders
+are looked up by their (unique, indexed) order number.
+
+Orders with wallet entries stay where they are. The wallet ledger is
+append-only and links each debit and refund to its order; archiving would
+have to null that link, an UPDATE on the ledger that loses which order an
+entry paid for. There are few such orders next to cash ones, and
+``WalletEntry.order`` is PROTECT so nothing else deletes them either.
+
+Everything works in batches of ``RETENTION_BATCH_SIZE`` rows, each in its own
+short transaction, so a first run over years of data does not lock the tables.
+"""
+import calendar
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.utils import timezone
+
+from backend.models import ArchivedOrder, Cart, Order, OrderItem, OrderSequence, OrderStatus, Receipt, WalletEntry
+
+
+def _batch_size():
+    return settings.RETENTION_BATCH_SIZE
+
+
+def _months_ago(now, months):
+    month = now.month - 1 - months
+    year, month = now.year + month // 12, month % 12 + 1
+    day = min(now.day, calendar.monthrange(year, month)[1])
+    return now.replace(year=year, month=month, day=day)
+
+
+def _delete_in_batches(queryset):
+    removed = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:_batch_size()])
+        if not ids:
+            return removed
+        removed += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+def sweep_carts(days=None):
+    """Delete orphaned and stale cart rows. Returns ``(orphaned, stale)``."""
+    days = settings.CART_RETENTION_DAYS if days is None else days
+    orphaned = _delete_in_batches(Cart.objects.filter(Q(custom_user__isnull=True) | Q(product__isnull=True)))
+    stale = _delete_in_batches(Cart.objects.filter(updated_at__lt=timezone.now() - datetime.timedelta(days=days)))
+    return orphaned, stale
+
+
+def prune_sequences():
+    """Drop order number counters for past days; only today's is ever bumped."""
+    return OrderSequence.objects.filter(date__lt=datetime.date.today()).delete()[0]
+
+
+def _archive(order):
+    items = [
+        {
+            'product_id': item.product_id,
+            'name': item.product.name if item.product else None,
+            'qty': item.qty,
+            'unit_price': str(item.unit_price),
+            'amount': str(item.amount),
+            'discount': item.discount,
+        }
+        for item in order.order_items.all()
+    ]
+    return ArchivedOrder(
+        order_number=order.order_number,
+        customer_id=order.customer_id,
+        outlet_id=order.outlet_id,
+        order_date=order.order_date,
+        total_amount=order.total_amount,
+        order_status=order.order_status,
+        payment_method=order.payment_method,
+        item_count=sum(item['qty'] for item in items),
+        data={
+            'items': items,
+            'pickup_slot': str(order.pickup_slot) if order.pickup_slot_id else None,
+        },
+    )
+
+
+def archive_orders(months=None):
+    """Move finished orders older than ``months`` into ArchivedOrder. Returns the number moved."""
+    from backend.receipts import render_receipts
+
+    months = settings.ORDER_RETENTION_MONTHS if months is None else months
+    # Pending orders are never archived, however old, nor are orders the wallet ledger points at
+    old = Order.objects.filter(
+        ~Exists(WalletEntry.objects.filter(order=OuterRef('pk'))),
+        order_date__lt=_months_ago(timezone.now(), months),
+        order_status__in=[OrderStatus.APPROVED, OrderStatus.REJECTED],
+    ).order_by('id')
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = old.select_related('pickup_slot').prefetch_related(
+                Prefetch('order_items', queryset=OrderItem.objects.select_related('product'))
+            )
+            orders = list(batch[:_batch_size()])
+            if not orders:
+                return moved
+
+            # Approved orders keep their receipt, so render any that are missing first
+            approved = [order for order in orders if order.order_status == OrderStatus.APPROVED]
+            have_receipt = set(
+                Receipt.objects.filter(order_number__in=[order.order_number for order in approved])
+                .values_list('order_number', flat=True)
+            )
+            missing = [order.id for order in approved if order.order_number not in have_receipt]
+            if missing:
+                render_receipts(missing)
+
+            # Copy and delete in one transaction: an order is in exactly one of the two tables.
+            # An order number already in the archive raises IntegrityError and the batch rolls back.
+            ArchivedOrder.objects.bulk_create([_archive(order) for order in orders])
+            Order.objects.filter(id__in=[order.id for order in orders]).delete()
+        moved += len(orders)
+
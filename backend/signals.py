@@ -0,0 +1,122 @@
+"""
+Signals sent by the backend app, and the receivers that keep derived data in
+step with them. Receivers are connected in BackendConfig.ready(); they import
+the feature modules they call lazily so app start-up stays cheap.
+"""
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import Signal, receiver
+
+from backend.models import Order, OrderItem, OrderStatus, Product, PriceRule, Category, PaymentMethodStatus, \
+    WalletEntryKind, Outlet
+
+# Sent once per batch by backend.orders.transition() inside its transaction,
+# with order_ids, from_status and to_status.
+order_status_changed = Signal()
+
+
+@receiver(order_status_changed)
+def update_stock(sender, order_ids, to_status, **kwargs):
+    # Approved orders consume stock: one aggregate query and one UPDATE for the batch
+    if to_status != OrderStatus.APPROVED:
+        return
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+        .values_list('product_id')
+        .annotate(total=Sum('qty'))
+    )
+    if not quantities:
+        return
+    Product.objects.filter(id__in=quantities, qty__isnull=False).update(
+        qty=F('qty') - Case(
+            *[When(id=product_id, then=Value(total)) for product_id, total in quantities.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+@receiver(order_status_changed)
+def release_pickup_slots(sender, order_ids, to_status, **kwargs):
+    # Rejected orders give their pickup slot places back
+    from backend.slots import release
+
+    if to_status != OrderStatus.REJECTED:
+        return
+    per_slot = (
+        Order.objects.filter(id__in=order_ids, pickup_slot__isnull=False)
+        .values_list('pickup_slot_id')
+        .annotate(total=Count('id'))
+    )
+    for slot_id, total in per_slot:
+        release(slot_id, total)
+
+
+@receiver(order_status_changed)
+def refund_wallet_orders(sender, order_ids, to_status, **kwargs):
+    # Rejected orders that were paid from the wallet are credited back
+    from backend.wallet import credit
+
+    if to_status != OrderStatus.REJECTED:
+        return
+    paid = Order.objects.filter(
+        id__in=order_ids, payment_method=PaymentMethodStatus.WALLET, customer__isnull=False,
+        total_amount__gt=0,
+    ).select_related('customer')
+    for order in paid:
+        credit(
+            order.customer, order.total_amount, kind=WalletEntryKind.REFUND,
+            order=order, reference=f"refund:{order.order_number}",
+        )
+
+
+@receiver(order_status_changed)
+def update_rollups(sender, order_ids, to_status, **kwargs):
+    # Per-outlet daily totals move with the approved batch, in the same transaction
+    from backend.outlets import record_approved
+
+    if to_status != OrderStatus.APPROVED:
+        return
+    record_approved(order_ids)
+
+
+@receiver(order_status_changed)
+def render_receipts(sender, order_ids, to_status, **kwargs):
+    # Receipts for the whole approved batch are rendered in one background task
+    from backend.tasks import enqueue
+
+    if to_status != OrderStatus.APPROVED:
+        return
+    enqueue('backend.receipts.render_receipts', {'order_ids': list(order_ids)})
+
+
+@receiver(order_status_changed)
+def notify_customers(sender, order_ids, to_status, **kwargs):
+    # One background task for the whole batch
+    from backend.tasks import enqueue
+
+    enqueue(
+        'backend.tasks.send_order_status_emails',
+        {'order_ids': list(order_ids), 'status': to_status},
+    )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=PriceRule)
+@receiver(post_delete, sender=PriceRule)
+@receiver(post_delete, sender=Category)
+@receiver(m2m_changed, sender=PriceRule.products.through)
+def invalidate_price_table(sender, **kwargs):
+    # Every process rebuilds its compiled price table on its next lookup
+    from backend.pricing import bump_version
+
+    bump_version()
+
+
+@receiver(post_save, sender=Outlet)
+@receiver(post_delete, sender=Outlet)
+def invalidate_outlets(sender, **kwargs):
+    from backend.outlets import invalidate
+
+    invalidate()
@@ -0,0 +1,147 @@
+"""
+Pickup time slots with per-slot capacity.
+
+A slot is reserved at checkout with a single conditional UPDATE on its
+``reserved`` counter, so concurrent checkouts can never overbook it. The list
+of open slots for a day is cached and dropped whenever a counter changes.
+
+Slots without an outlet are shared: every outlet offers them alongside its own.
+"""
+import datetime
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from backend.models import PickupSlot, Order, OrderItem, OrderStatus
+
+CACHE_TIMEOUT = 60
+
+
+def _cache_key(date, outlet_id=None):
+    return f"slots:{outlet_id or 0}:{date.isoformat()}"
+
+
+def _affected_keys(date, outlet_id):
+    # A shared slot appears in every outlet's cached list
+    if outlet_id is not None:
+        return [_cache_key(date, outlet_id)]
+    from backend.outlets import active_outlets
+
+    return [_cache_key(date)] + [_cache_key(date, outlet['id']) for outlet in active_outlets()]
+
+
+def _invalidate(date, outlet_id=None):
+    keys = _affected_keys(date, outlet_id)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _for_outlet(outlet_id):
+    if outlet_id is None:
+        return Q(outlet__isnull=True)
+    return Q(outlet_id=outlet_id) | Q(outlet__isnull=True)
+
+
+def available_slots(date=None, outlet=None):
+    """Open slots for ``date`` (today by default) as ``[{'id', 'label', 'remaining'}]``."""
+    date = date or timezone.localdate()
+    outlet_id = outlet.pk if outlet is not None else None
+    key = _cache_key(date, outlet_id)
+    slots = cache.get(key)
+    if slots is None:
+        slots = [
+            {'id': slot.id, 'label': str(slot), 'start_time': slot.start_time, 'remaining': slot.remaining}
+            for slot in PickupSlot.objects.filter(_for_outlet(outlet_id), date=date, reserved__lt=F('capacity'))
+        ]
+        cache.set(key, slots, CACHE_TIMEOUT)
+
+    # Slots that have already started are not offered, without touching the cache
+    if date == timezone.localdate():
+        now = timezone.localtime().time()
+        slots = [slot for slot in slots if slot['start_time'] > now]
+    return slots
+
+
+def reserve(slot_id, count=1, outlet=None):
+    """
+    Take ``count`` places in one of ``outlet``'s slots or a shared one.
+    Returns the slot, or None if it is full, gone or has already started.
+    """
+    outlet_id = outlet.pk if outlet is not None else None
+    now = timezone.localtime()
+    # Same rule as available_slots(): later days, or later today
+    upcoming = Q(date__gt=now.date()) | Q(date=now.date(), start_time__gt=now.time())
+    updated = PickupSlot.objects.filter(
+        _for_outlet(outlet_id), upcoming, pk=slot_id, reserved__lte=F('capacity') - count
+    ).update(reserved=F('reserved') + count)
+    if not updated:
+        return None
+    slot = PickupSlot.objects.get(pk=slot_id)
+    _invalidate(slot.date, slot.outlet_id)
+    return slot
+
+
+def release(slot_id, count=1):
+    """Give places back, e.g. when an order is rejected."""
+    slot = PickupSlot.objects.filter(pk=slot_id).first()
+    if slot is None:
+        return
+    PickupSlot.objects.filter(pk=slot_id, reserved__gte=count).update(reserved=F('reserved') - count)
+    _invalidate(slot.date, slot.outlet_id)
+
+
+def create_slots(date, start, end, minutes, capacity, outlet=None):
+    """Create back-to-back slots between ``start`` and ``end``; existing ones are kept."""
+    slots = []
+    current = datetime.datetime.combine(date, start)
+    finish = datetime.datetime.combine(date, end)
+    step = datetime.timedelta(minutes=minutes)
+    while current + step <= finish:
+        slots.append(PickupSlot(
+            outlet=outlet, date=date, start_time=current.time(), end_time=(current + step).time(), capacity=capacity
+        ))
+        current += step
+    PickupSlot.objects.bulk_create(slots, ignore_conflicts=True)
+    cache.delete_many(_affected_keys(date, outlet.pk if outlet is not None else None))
+    return len(slots)
+
+
+def kitchen_batches(date=None, outlet=None):
+    """
+    PENDING orders for ``date`` grouped by slot, each with the product
+    quantities the kitchen has to prepare. Orders without a slot come first.
+    With an ``outlet`` only that counter's orders (and any without an outlet)
+    are included.
+    """
+    date = date or timezone.localdate()
+    # Slot orders for the day plus any ASAP orders still waiting
+    pending = Order.objects.filter(
+        Q(pickup_slot__date=date) | Q(pickup_slot__isnull=True),
+        order_status=OrderStatus.PENDING,
+    )
+    if outlet is not None:
+        pending = pending.filter(Q(outlet=outlet) | Q(outlet__isnull=True))
+
+    batches = OrderedDict()
+    for order in pending.select_related('pickup_slot', 'customer').order_by(
+        F('pickup_slot__start_time').asc(nulls_first=True), 'id'
+    ):
+        batch = batches.setdefault(order.pickup_slot_id, {
+            'slot': order.pickup_slot, 'orders': [], 'products': [],
+        })
+        batch['orders'].append(order)
+
+    totals = (
+        OrderItem.objects.filter(order__in=pending)
+        .values('order__pickup_slot_id', 'product__name')
+        .annotate(total=Sum('qty'))
+        .order_by('order__pickup_slot_id', '-total')
+    )
+    for row in totals:
+        batch = batches.get(row['order__pickup_slot_id'])
+        if batch is not None:
+            batch['products'].append({'name': row['product__name'] or '-', 'qty': row['total']})
+
+    return list(batches.values())
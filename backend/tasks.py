@@ -0,0 +1,203 @@
+"""
+Lightweight DB-backed task queue.
+
+Views call ``enqueue()`` for slow side effects (emails, receipts, kitchen
+tickets...) and return straight away; the ``run_tasks`` management command
+picks the rows up and runs them with retries and exponential backoff. A task
+left RUNNING by a worker that died is put back in the queue once it has not
+been updated for ``TASK_LEASE_TIMEOUT`` seconds.
+
+With ``TASKS_EAGER = True`` tasks run synchronously inside ``enqueue()``,
+which is what the tests use.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail, send_mass_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from backend.models import Task, TaskStatus, Order, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _eager():
+    return getattr(settings, 'TASKS_EAGER', False)
+
+
+def _backoff(attempts):
+    # 30s, 60s, 120s, ... capped at one hour
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """
+    Queue ``name`` (dotted path of a handler) to be called with ``**payload``.
+
+    If a task with the same idempotency ``key`` already exists the existing
+    row is returned and nothing new is queued.
+    """
+    if key:
+        existing = Task.objects.filter(idempotency_key=key).first()
+        if existing:
+            return existing
+
+    try:
+        with transaction.atomic():
+            task = Task.objects.create(
+                name=name,
+                payload=payload or {},
+                idempotency_key=key,
+                max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 5),
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        # Lost the race against another request enqueueing the same key
+        return Task.objects.get(idempotency_key=key)
+
+    if _eager():
+        run_task(task)
+        task.refresh_from_db()
+
+    return task
+
+
+def _claim(task):
+    # Conditional UPDATE so two workers can never run the same row
+    return Task.objects.filter(pk=task.pk, status=TaskStatus.QUEUED).update(
+        status=TaskStatus.RUNNING,
+        attempts=task.attempts + 1,
+        updated_at=timezone.now(),
+    ) == 1
+
+
+def run_task(task):
+    """Claim and execute a single task. Returns True if the handler succeeded."""
+    if not _claim(task):
+        return False
+    task.refresh_from_db()
+
+    try:
+        handler = import_string(task.name)
+        # A savepoint, so a failing handler cannot break a surrounding
+        # transaction (eager mode runs inside the caller's, e.g. place_order)
+        with transaction.atomic():
+            handler(**task.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Task %s (%s) failed, attempt %s', task.id, task.name, task.attempts)
+        if task.attempts >= task.max_attempts:
+            status, run_at = TaskStatus.FAILED, task.run_at
+        else:
+            status, run_at = TaskStatus.QUEUED, timezone.now() + _backoff(task.attempts)
+        Task.objects.filter(pk=task.pk).update(
+            status=status, run_at=run_at, last_error=error, updated_at=timezone.now()
+        )
+        return False
+
+    Task.objects.filter(pk=task.pk).update(
+        status=TaskStatus.DONE, last_error='', updated_at=timezone.now()
+    )
+    return True
+
+
+def requeue_stale():
+    """
+    Hand RUNNING tasks whose worker died (no update for ``TASK_LEASE_TIMEOUT``
+    seconds) back to the queue, or fail them if they are out of attempts.
+    Returns the number of rows recovered.
+    """
+    now = timezone.now()
+    stale = Task.objects.filter(
+        status=TaskStatus.RUNNING,
+        updated_at__lt=now - timedelta(seconds=getattr(settings, 'TASK_LEASE_TIMEOUT', 600)),
+    )
+    error = 'Lease expired: the worker stopped while running this task.'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=TaskStatus.FAILED, last_error=error, updated_at=now
+    )
+    requeued = stale.update(status=TaskStatus.QUEUED, run_at=now, last_error=error, updated_at=now)
+    if failed or requeued:
+        logger.warning('Recovered %s stale task(s), %s of them failed', failed + requeued, failed)
+    return failed + requeued
+
+
+def run_pending(batch_size=100):
+    """Run up to ``batch_size`` due tasks. Returns the number processed."""
+    requeue_stale()
+    due = list(
+        Task.objects.filter(status=TaskStatus.QUEUED, run_at__lte=timezone.now())
+        .order_by('run_at')[:batch_size]
+    )
+    for task in due:
+        run_task(task)
+    return len(due)
+
+
+def queue_depth():
+    """Task counts per status plus the age (seconds) of the oldest due task."""
+    counts = {status: 0 for status in TaskStatus.values}
+    for row in Task.objects.values('status').annotate(total=Count('id')):
+        counts[row['status']] = row['total']
+
+    oldest = Task.objects.filter(
+        status=TaskStatus.QUEUED, run_at__lte=timezone.now()
+    ).aggregate(oldest=Min('run_at'))['oldest']
+    counts['oldest_due_age'] = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return counts
+
+
+# Order side effects
+
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('customer').get(pk=order_id)
+    user = order.customer
+    if not user or not user.email:
+        return
+
+    subject = f"Order Confirmation - {order.order_number}"
+    message = (
+        f"Dear {user.first_name},\n\n"
+        f"Thank you for your order #{order.order_number}.\n"
+        f"Total Amount: ₹{order.total_amount}\n\n"
+        f"We will notify you once your order is shipped.\n\n"
+        f"Best regards,\n"
+        f"Your Company Name"
+    )
+    send_mail(
+        subject,
+        message,
+        settings.DEFAULT_FROM_EMAIL,
+        [user.email],
+        fail_silently=False,
+    )
+
+
+def send_order_status_emails(order_ids, status):
+    orders = (
+        Order.objects.filter(id__in=order_ids, customer__isnull=False)
+        .exclude(customer__email='')
+        .select_related('customer')
+    )
+    label = OrderStatus(status).label
+    messages = [
+        (
+            f"Order {order.order_number} {label}",
+            (
+                f"Dear {order.customer.first_name},\n\n"
+                f"Your order #{order.order_number} has been {label.lower()}.\n\n"
+                f"Best regards,\n"
+                f"Your Company Name"
+            ),
+            settings.DEFAULT_FROM_EMAIL,
+            [order.customer.email],
+        )
+        for order in orders
+    ]
+    send_mass_mail(messages, fail_silently=False)
@@ -1,3 +1,447 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from backend.forms import PriceRuleForm
+from backend import pricing, recommendations, retention, slots, tasks, wallet
+from backend.models import ArchivedOrder, Cart, Category, CustomerProductStat, CustomUser, Order, OrderItem, \
+    OrderStatus, PaymentMethodStatus, PickupSlot, PriceRule, PriceRuleKind, Product, ProductPair, Task, TaskStatus, \
+    WalletEntry, WalletEntryKind
+from backend.orders import transition
+from backend.signals import order_status_changed
+
+
+def failing_task(message):
+    raise ValueError(message)
+
+
+def noop_task():
+    pass
+
+
+def db_error_task():
+    Task.objects.create(name='broken')  # run_at is NOT NULL
+
+
+@override_settings(TASKS_EAGER=False, TASK_RETRY_BACKOFF=30, TASK_LEASE_TIMEOUT=600)
+class TaskQueueTests(TestCase):
+    def test_enqueue_same_key_once(self):
+        first = tasks.enqueue('backend.tests.noop_task', key='once')
+        second = tasks.enqueue('backend.tests.noop_task', key='once')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failure_retries_with_backoff_then_fails(self):
+        task = tasks.enqueue('backend.tests.failing_task', {'message': 'boom'}, max_attempts=2)
+
+        before = timezone.now()
+        self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (TaskStatus.QUEUED, 1))
+        self.assertIn('boom', task.last_error)
+        self.assertGreaterEqual(task.run_at, before + timedelta(seconds=30))
+
+        # Not due yet
+        self.assertEqual(tasks.run_pending(), 0)
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (TaskStatus.FAILED, 2))
+
+    def test_backoff_doubles_and_is_capped(self):
+        self.assertEqual(tasks._backoff(1), timedelta(seconds=30))
+        self.assertEqual(tasks._backoff(3), timedelta(seconds=120))
+        self.assertEqual(tasks._backoff(20), timedelta(hours=1))
+
+    def test_success_marks_done(self):
+        task = tasks.enqueue('backend.tests.noop_task')
+        tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (TaskStatus.DONE, 1))
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_db_failure_leaves_outer_transaction_usable(self):
+        with transaction.atomic():
+            task = tasks.enqueue('backend.tests.db_error_task', max_attempts=1)
+            self.assertEqual(task.status, TaskStatus.FAILED)
+            self.assertIn('IntegrityError', task.last_error)
+            # Still usable after the failure
+            self.assertEqual(Task.objects.count(), 1)
+
+    def test_running_task_is_not_claimed_twice(self):
+        task = tasks.enqueue('backend.tests.noop_task')
+        Task.objects.filter(pk=task.pk).update(status=TaskStatus.RUNNING)
+        self.assertFalse(tasks.run_task(task))
+
+    def test_stale_running_task_is_requeued(self):
+        lost = tasks.enqueue('backend.tests.noop_task', max_attempts=3)
+        exhausted = tasks.enqueue('backend.tests.noop_task', max_attempts=1)
+        fresh = tasks.enqueue('backend.tests.noop_task')
+        long_ago = timezone.now() - timedelta(seconds=601)
+        Task.objects.filter(pk__in=[lost.pk, exhausted.pk]).update(
+            status=TaskStatus.RUNNING, attempts=1, updated_at=long_ago
+        )
+        Task.objects.filter(pk=fresh.pk).update(status=TaskStatus.RUNNING, attempts=1)
+
+        self.assertEqual(tasks.requeue_stale(), 2)
+        statuses = dict(Task.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[lost.pk], TaskStatus.QUEUED)
+        self.assertEqual(statuses[exhausted.pk], TaskStatus.FAILED)
+        self.assertEqual(statuses[fresh.pk], TaskStatus.RUNNING)
+
+        tasks.run_pending()
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts), (TaskStatus.DONE, 2))
+
+
+class PickupSlotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.slot = PickupSlot.objects.create(
+            date=timezone.localdate() + timedelta(days=1),
+            start_time=time(12, 0),
+            end_time=time(12, 15),
+            capacity=2,
+        )
+
+    def test_reserve_never_overbooks(self):
+        self.assertIsNotNone(slots.reserve(self.slot.id))
+        self.assertIsNotNone(slots.reserve(self.slot.id))
+        self.assertIsNone(slots.reserve(self.slot.id))
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.reserved, 2)
+
+    def test_reserve_more_than_remaining(self):
+        slots.reserve(self.slot.id)
+        self.assertIsNone(slots.reserve(self.slot.id, count=2))
+
+    def test_release_reopens_slot(self):
+        slots.reserve(self.slot.id, count=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            slots.release(self.slot.id)
+        self.assertEqual([slot['id'] for slot in slots.available_slots(self.slot.date)], [self.slot.id])
+        self.assertIsNotNone(slots.reserve(self.slot.id))
+
+    def test_past_and_started_slots_cannot_be_reserved(self):
+        now = timezone.localtime()
+        yesterday = PickupSlot.objects.create(
+            date=now.date() - timedelta(days=1), start_time=time(23, 0), end_time=time(23, 15), capacity=5
+        )
+        self.assertIsNone(slots.reserve(yesterday.id))
+        if now.time() > time(0, 1):
+            started = PickupSlot.objects.create(
+                date=now.date(), start_time=time(0, 0), end_time=time(0, 1), capacity=5
+            )
+            self.assertIsNone(slots.reserve(started.id))
+        self.assertIsNotNone(slots.reserve(self.slot.id))
+
+    def test_full_slot_is_not_offered(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            slots.reserve(self.slot.id, count=2)
+        self.assertEqual(slots.available_slots(self.slot.date), [])
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.product = Product.objects.create(
+            name='Samosa', category=Category.objects.create(name='Snacks'), price=Decimal('10'), qty=10
+        )
+        self.orders = [self.make_order(qty) for qty in (1, 2, 3)]
+
+    def make_order(self, qty):
+        order = Order.objects.create(customer=self.user, total_amount=10 * qty)
+        OrderItem.objects.create(
+            order=order, product=self.product, qty=qty, unit_price=10, amount=10 * qty, discount=0
+        )
+        return order
+
+    def ids(self):
+        return [order.id for order in self.orders]
+
+    def test_only_pending_orders_move(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(order_status=OrderStatus.REJECTED)
+        self.assertEqual(sorted(transition(self.ids(), OrderStatus.APPROVED)), self.ids()[1:])
+        self.assertEqual(transition(self.ids(), OrderStatus.REJECTED), [])
+        statuses = list(Order.objects.order_by('id').values_list('order_status', flat=True))
+        self.assertEqual(statuses, [OrderStatus.REJECTED, OrderStatus.APPROVED, OrderStatus.APPROVED])
+
+    def test_stock_is_taken_once(self):
+        transition(self.ids(), OrderStatus.APPROVED)
+        transition(self.ids(), OrderStatus.APPROVED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.qty, 10 - 6)
+
+    def test_one_signal_per_batch(self):
+        batches = []
+
+        def receiver(sender, order_ids, **kwargs):
+            batches.append(sorted(order_ids))
+
+        order_status_changed.connect(receiver)
+        self.addCleanup(order_status_changed.disconnect, receiver)
+        transition(self.ids(), OrderStatus.REJECTED)
+        self.assertEqual(batches, [self.ids()])
+
+    def test_disallowed_transition(self):
+        with self.assertRaises(ValueError):
+            transition(self.ids(), OrderStatus.PENDING, from_status=OrderStatus.APPROVED)
+
+    def test_admin_locks_status_once_decided(self):
+        model_admin = admin.site._registry[Order]
+        request = RequestFactory().get('/')
+        self.assertNotIn('order_status', model_admin.get_readonly_fields(request, self.orders[0]))
+        transition([self.orders[0].id], OrderStatus.APPROVED)
+        self.orders[0].refresh_from_db()
+        self.assertIn('order_status', model_admin.get_readonly_fields(request, self.orders[0]))
+
+
+class PriceTableTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.product = Product.objects.create(name='Tea', price=Decimal('5'), qty=10)
+        self.cart = [Cart(custom_user=self.user, product=self.product, qty=2)]
+
+    def test_saved_price_reaches_other_processes(self):
+        self.assertEqual(pricing.quote(self.cart).total, Decimal('10'))
+        stale = pricing.get_table()
+
+        self.product.price = Decimal('6')
+        self.product.save()
+        # The version lives in the shared cache, so a table built before the save is outdated everywhere
+        self.assertNotEqual(cache.get(pricing.VERSION_KEY), stale.version)
+        self.assertEqual(pricing.quote(self.cart).total, Decimal('12'))
+
+
+class PriceRuleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.snacks = Category.objects.create(name='Snacks')
+        self.samosa = Product.objects.create(name='Samosa', category=self.snacks, price=Decimal('10'), qty=10)
+        self.tea = Product.objects.create(name='Tea', price=Decimal('5'), qty=10)
+
+    def rule(self, kind, percent, products=(), **fields):
+        rule = PriceRule.objects.create(name=kind, kind=kind, discount_percent=percent, **fields)
+        rule.products.set(products)
+        pricing.bump_version()
+        return rule
+
+    def percents(self, *products, staff=False, at=None):
+        items = [Cart(product=product, qty=1) for product in products]
+        at = timezone.make_aware(at) if at else None
+        return [line.discount for line in pricing.quote(items, staff=staff, now=at).lines]
+
+    def test_combo_needs_every_product(self):
+        self.rule(PriceRuleKind.COMBO, 15, products=[self.samosa, self.tea])
+        self.assertEqual(self.percents(self.samosa), [0])
+        self.assertEqual(self.percents(self.samosa, self.tea), [15, 15])
+
+    def test_time_window_wraps_past_midnight(self):
+        self.rule(PriceRuleKind.TIME_OF_DAY, 20, start_time=time(22, 0), end_time=time(2, 0))
+        self.assertEqual(self.percents(self.tea, at=datetime(2026, 1, 1, 23, 30)), [20])
+        self.assertEqual(self.percents(self.tea, at=datetime(2026, 1, 2, 1, 59)), [20])
+        self.assertEqual(self.percents(self.tea, at=datetime(2026, 1, 2, 2, 0)), [0])
+        self.assertEqual(self.percents(self.tea, at=datetime(2026, 1, 2, 12, 0)), [0])
+
+    def test_staff_only(self):
+        self.rule(PriceRuleKind.STAFF, 25)
+        self.assertEqual(self.percents(self.tea), [0])
+        self.assertEqual(self.percents(self.tea, staff=True), [25])
+
+    def test_best_single_discount_wins(self):
+        self.rule(PriceRuleKind.CATEGORY, 20, category=self.snacks)
+        self.rule(PriceRuleKind.TIME_OF_DAY, 10, products=[self.samosa], start_time=time(0, 0), end_time=time(23, 59))
+        self.rule(PriceRuleKind.STAFF, 15)
+        self.assertEqual(self.percents(self.samosa, self.tea, staff=True), [20, 15])
+        quote = pricing.quote([Cart(product=self.samosa, qty=3)])
+        self.assertEqual(
+            (quote.subtotal, quote.discount_total, quote.total), (Decimal('30'), Decimal('6'), Decimal('24'))
+        )
+
+    def test_incomplete_rules_are_rejected(self):
+        for kind, fields, field in [
+            (PriceRuleKind.CATEGORY, {}, 'category'),
+            (PriceRuleKind.TIME_OF_DAY, {'start_time': time(9, 0)}, 'start_time'),
+            (PriceRuleKind.STAFF, {'discount_percent': 150}, 'discount_percent'),
+            (PriceRuleKind.STAFF, {'valid_from': date(2026, 2, 1), 'valid_to': date(2026, 1, 1)}, 'valid_to'),
+        ]:
+            rule = PriceRule(name='x', kind=kind, **{'discount_percent': 10, **fields})
+            with self.assertRaises(ValidationError) as raised:
+                rule.full_clean()
+            self.assertIn(field, raised.exception.message_dict, kind)
+
+        form = PriceRuleForm({
+            'name': 'x', 'kind': PriceRuleKind.COMBO, 'discount_percent': 10, 'products': [self.tea.id],
+        })
+        self.assertIn('products', form.errors)
+
+    def test_incomplete_saved_rule_is_not_global(self):
+        # e.g. created before validation existed
+        self.rule(PriceRuleKind.CATEGORY, 90)
+        self.rule(PriceRuleKind.TIME_OF_DAY, 90)
+        self.assertEqual(self.percents(self.samosa, self.tea), [0, 0])
+
+
+class WalletTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        wallet.credit(self.user, '50', reference='topup-1')
+
+    def test_debit_moves_balance_and_ledger(self):
+        entry = wallet.debit(self.user, '20')
+        self.assertEqual(wallet.get_balance(self.user), Decimal('30'))
+        self.assertEqual((entry.amount, entry.balance_after), (Decimal('-20'), Decimal('30')))
+
+    def test_debit_never_overdraws(self):
+        with self.assertRaises(wallet.InsufficientBalance):
+            wallet.debit(self.user, '50.01')
+        self.assertEqual(wallet.get_balance(self.user), Decimal('50'))
+        self.assertEqual(WalletEntry.objects.count(), 1)
+
+    def test_rejected_wallet_order_is_refunded_once(self):
+        order = Order.objects.create(
+            customer=self.user, total_amount=Decimal('20'), payment_method=PaymentMethodStatus.WALLET
+        )
+        wallet.debit(self.user, '20', order=order, reference=f"order:{order.order_number}")
+
+        transition([order.id], OrderStatus.REJECTED)
+        transition([order.id], OrderStatus.REJECTED)
+        self.assertEqual(wallet.get_balance(self.user), Decimal('50'))
+        refund = WalletEntry.objects.get(kind=WalletEntryKind.REFUND)
+        self.assertEqual((refund.order, refund.amount), (order, Decimal('20')))
+
+    def test_topup_import_skips_seen_references(self):
+        rows = [('customer@example.com', '10', 'topup-2'), ('customer@example.com', '10', 'topup-1')]
+        self.assertEqual(wallet.import_topups(rows), (1, 1))
+        self.assertEqual(wallet.import_topups(rows), (0, 2))
+        self.assertEqual(wallet.get_balance(self.user), Decimal('60'))
+
+    def test_amounts_are_validated(self):
+        self.assertEqual(wallet.parse_amount(' 12.5 '), Decimal('12.50'))
+        for value in ['', 'abc', 'Infinity', 'NaN', '0', '-5', '0.001', '10.005', '99999999999']:
+            with self.assertRaises(ValueError, msg=value):
+                wallet.parse_amount(value)
+            with self.assertRaises(ValueError, msg=value):
+                wallet.credit(self.user, value)
+        self.assertEqual(wallet.get_balance(self.user), Decimal('50'))
+
+    def test_topup_import_skips_bad_amounts(self):
+        rows = [('customer@example.com', 'Infinity', 'a'), ('customer@example.com', '0.001', 'b'),
+                ('customer@example.com', '1e12', 'c'), ('customer@example.com', '2.50', 'd')]
+        self.assertEqual(wallet.import_topups(rows), (1, 3))
+        self.assertEqual(wallet.get_balance(self.user), Decimal('52.50'))
+
+    def test_checkpoint_matches_ledger(self):
+        wallet.debit(self.user, '5')
+        self.assertEqual(wallet.checkpoint(), (1, []))
+        self.assertEqual(wallet.checkpoint(), (0, []))
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.product = Product.objects.create(name='Tea', price=Decimal('5'), qty=10)
+
+    def old_order(self, status):
+        order = Order.objects.create(customer=self.user, total_amount=Decimal('5'), order_status=status)
+        OrderItem.objects.create(order=order, product=self.product, qty=1, unit_price=5, amount=5, discount=0)
+        Order.objects.filter(pk=order.pk).update(order_date=timezone.now() - timedelta(days=400))
+        return order
+
+    def test_old_finished_orders_are_archived(self):
+        rejected = self.old_order(OrderStatus.REJECTED)
+        pending = self.old_order(OrderStatus.PENDING)
+        self.assertEqual(retention.archive_orders(months=12), 1)
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [pending.id])
+        archived = ArchivedOrder.objects.get(order_number=rejected.order_number)
+        self.assertEqual(archived.item_count, 1)
+        self.assertEqual(archived.data['items'][0]['name'], 'Tea')
+
+    def test_wallet_paid_orders_are_kept(self):
+        wallet.credit(self.user, Decimal('10'))
+        paid = self.old_order(OrderStatus.APPROVED)
+        entry = wallet.debit(self.user, Decimal('5'), order=paid, reference=f'order:{paid.order_number}')
+        cash = self.old_order(OrderStatus.APPROVED)
+        self.assertEqual(retention.archive_orders(months=12), 1)
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [paid.id])
+        self.assertTrue(ArchivedOrder.objects.filter(order_number=cash.order_number).exists())
+        self.assertEqual(WalletEntry.objects.get(pk=entry.pk).order_id, paid.id)
+
+    def test_conflicting_archive_row_keeps_the_order(self):
+        order = self.old_order(OrderStatus.REJECTED)
+        ArchivedOrder.objects.create(
+            order_number=order.order_number, order_date=order.order_date,
+            order_status=OrderStatus.REJECTED, payment_method=order.payment_method,
+        )
+        with self.assertRaises(IntegrityError):
+            retention.archive_orders(months=12)
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 1)
+
+    def test_orphaned_and_stale_carts_are_swept(self):
+        Cart.objects.create(custom_user=None, product=self.product, qty=1)
+        stale = Cart.objects.create(custom_user=self.user, product=self.product, qty=1)
+        Cart.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=31))
+        kept = Cart.objects.create(custom_user=self.user, product=self.product, qty=1)
+        self.assertEqual(retention.sweep_carts(days=30), (1, 1))
+        self.assertEqual(list(Cart.objects.values_list('id', flat=True)), [kept.id])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.samosa, self.tea, self.cake = [
+            Product.objects.create(name=name, price=Decimal('5'), qty=10) for name in ('Samosa', 'Tea', 'Cake')
+        ]
+
+    def order(self, *quantities, customer=None):
+        order = Order.objects.create(customer=customer or self.user, total_amount=0)
+        for product, qty in quantities:
+            OrderItem.objects.create(order=order, product=product, qty=qty, unit_price=5, amount=5 * qty, discount=0)
+        return order
+
+    def counters(self):
+        stats = set(CustomerProductStat.objects.values_list('product_id', 'times_ordered', 'qty_total'))
+        pairs = set(ProductPair.objects.values_list('product_id', 'paired_product_id', 'times_together'))
+        return stats, pairs
+
+    def test_record_order_bumps_counters(self):
+        recommendations.record_order(self.order((self.samosa, 2), (self.tea, 1)).id)
+        recommendations.record_order(self.order((self.samosa, 1)).id)
+        stats, pairs = self.counters()
+        self.assertEqual(stats, {(self.samosa.id, 2, 3), (self.tea.id, 1, 1)})
+        self.assertEqual(pairs, {(self.samosa.id, self.tea.id, 1), (self.tea.id, self.samosa.id, 1)})
+        self.assertEqual(recommendations.get_recommendations(self.user.id)['top'], [self.samosa.id, self.tea.id])
+
+    def test_rebuild_matches_incremental_counters(self):
+        for quantities in [((self.samosa, 2), (self.tea, 1)), ((self.samosa, 1), (self.cake, 3))]:
+            recommendations.record_order(self.order(*quantities).id)
+        incremental = self.counters()
+        self.assertEqual(recommendations.rebuild(), (3, 4))
+        self.assertEqual(self.counters(), incremental)
+
+    def test_suggestions_use_global_pairs(self):
+        other = CustomUser.objects.create_user('other@example.com', 'pw', phone='2')
+        recommendations.record_order(self.order((self.tea, 1), (self.cake, 1), customer=other).id)
+        # This customer never ordered tea, but others buy it with cake
+        self.assertEqual(recommendations.suggestions_for([self.tea.id]), [self.cake.id])
+        self.assertEqual(recommendations.suggestions_for([self.tea.id, self.cake.id]), [])
+
+        # New pairs show up at once, despite the cached entries above
+        recommendations.record_order(self.order((self.tea, 1), (self.samosa, 1)).id)
+        self.assertEqual(set(recommendations.suggestions_for([self.tea.id])), {self.cake.id, self.samosa.id})
+
+    def test_add_products_merges_with_cart(self):
+        Cart.objects.create(custom_user=self.user, product=self.samosa, qty=1)
+        Cart.add_products(self.user, {self.samosa.id: 2, self.tea.id: 1})
+        quantities = dict(Cart.objects.filter(custom_user=self.user).values_list('product_id', 'qty'))
+        self.assertEqual(quantities, {self.samosa.id: 3, self.tea.id: 1})
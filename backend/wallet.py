@@ -0,0 +1,195 @@
+"""
+Prepaid campus wallet.
+
+Every movement of money is a WalletEntry row in an append-only ledger. The
+wallet's ``balance`` column is moved by a conditional UPDATE in the same
+transaction, so balance reads never sum the ledger and two concurrent orders
+from one account cannot overdraw it. ``checkpoint()`` reconciles the balance
+against the entries added since the previous checkpoint.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Sum, Value, When
+from django.utils import timezone
+
+from backend.models import CustomUser, Wallet, WalletEntry, WalletEntryKind
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+# Largest value the ledger's DecimalField(max_digits=10, decimal_places=2) holds
+MAX_AMOUNT = Decimal('99999999.99')
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def parse_amount(value):
+    """
+    ``value`` as a Decimal in whole cents. Raises ValueError unless it is a
+    finite, positive amount that fits the ledger columns.
+    """
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not an amount.")
+    # NaN/Infinity first: NaN cannot even be compared
+    if not amount.is_finite():
+        raise ValueError(f"{value!r} is not an amount.")
+    if not 0 < amount <= MAX_AMOUNT:
+        raise ValueError(f"Amounts must be positive and at most {MAX_AMOUNT}.")
+    if amount != amount.quantize(CENT):
+        raise ValueError('Amounts cannot have fractions of a cent.')
+    return amount.quantize(CENT)
+
+
+def get_balance(user):
+    balance = Wallet.objects.filter(user=user).values_list('balance', flat=True).first()
+    return balance if balance is not None else Decimal('0')
+
+
+def _move(wallet_id, amount, kind, order=None, reference=None):
+    # The caller has already moved the balance inside this transaction
+    balance = Wallet.objects.filter(pk=wallet_id).values_list('balance', flat=True).get()
+    return WalletEntry.objects.create(
+        wallet_id=wallet_id,
+        kind=kind,
+        amount=amount,
+        balance_after=balance,
+        order=order,
+        reference=reference,
+    )
+
+
+def credit(user, amount, kind=WalletEntryKind.TOPUP, order=None, reference=None):
+    amount = parse_amount(amount)
+    with transaction.atomic():
+        wallet, _ = Wallet.objects.get_or_create(user=user)
+        Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + amount, updated_at=timezone.now())
+        return _move(wallet.pk, amount, kind, order=order, reference=reference)
+
+
+def debit(user, amount, order=None, reference=None):
+    """Take ``amount`` from the user's wallet or raise InsufficientBalance."""
+    amount = parse_amount(amount)
+    with transaction.atomic():
+        # Guarded UPDATE: only succeeds if the money is there at this instant
+        updated = Wallet.objects.filter(user=user, balance__gte=amount).update(
+            balance=F('balance') - amount, updated_at=timezone.now()
+        )
+        if not updated:
+            raise InsufficientBalance('Insufficient wallet balance.')
+        wallet_id = Wallet.objects.filter(user=user).values_list('id', flat=True).get()
+        return _move(wallet_id, -amount, WalletEntryKind.DEBIT, order=order, reference=reference)
+
+
+def import_topups(rows):
+    """
+    Credit many wallets at once from ``(email, amount, reference)`` rows.
+
+    References that were already imported are skipped, so a file can be
+    re-run safely. Returns ``(imported, skipped)``; rows for unknown emails or
+    with a bad amount are counted as skipped.
+    """
+    parsed = []
+    skipped = 0
+    for email, amount, reference in rows:
+        try:
+            amount = parse_amount(amount)
+        except ValueError:
+            skipped += 1
+            continue
+        if not reference:
+            skipped += 1
+            continue
+        parsed.append((email.strip(), amount, reference.strip()))
+
+    seen = set(
+        WalletEntry.objects.filter(reference__in=[row[2] for row in parsed]).values_list('reference', flat=True)
+    )
+    users = dict(
+        CustomUser.objects.filter(email__in=[row[0] for row in parsed]).values_list('email', 'id')
+    )
+
+    pending = []
+    for email, amount, reference in parsed:
+        if reference in seen or email not in users:
+            skipped += 1
+            continue
+        seen.add(reference)
+        pending.append((users[email], amount, reference))
+    if not pending:
+        return 0, skipped
+
+    with transaction.atomic():
+        Wallet.objects.bulk_create(
+            [Wallet(user_id=user_id) for user_id in {row[0] for row in pending}], ignore_conflicts=True
+        )
+        wallets, balances = {}, {}
+        locked = Wallet.objects.select_for_update().filter(user_id__in={row[0] for row in pending})
+        for user_id, wallet_id, balance in locked.values_list('user_id', 'id', 'balance'):
+            wallets[user_id] = wallet_id
+            balances[wallet_id] = balance
+
+        entries = []
+        totals = defaultdict(Decimal)
+        for user_id, amount, reference in pending:
+            wallet_id = wallets[user_id]
+            totals[wallet_id] += amount
+            entries.append(WalletEntry(
+                wallet_id=wallet_id,
+                kind=WalletEntryKind.TOPUP,
+                amount=amount,
+                balance_after=balances[wallet_id] + totals[wallet_id],
+                reference=reference,
+            ))
+        WalletEntry.objects.bulk_create(entries)
+        Wallet.objects.filter(id__in=totals).update(
+            balance=F('balance') + Case(
+                *[When(id=wallet_id, then=Value(total)) for wallet_id, total in totals.items()],
+                default=Value(Decimal('0')),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
+        )
+
+    return len(entries), skipped
+
+
+def checkpoint():
+    """
+    Fold the entries added since each wallet's last checkpoint into it, and
+    report wallets whose running balance disagrees with the ledger.
+    Returns ``(checkpointed, mismatched_wallet_ids)``.
+    """
+    now = timezone.now()
+    rows = (
+        WalletEntry.objects.filter(id__gt=F('wallet__checkpoint_entry_id'))
+        .values('wallet_id', 'wallet__balance', 'wallet__checkpoint_balance')
+        .annotate(delta=Sum('amount'), last_id=Max('id'))
+    )
+
+    updates = []
+    mismatched = []
+    for row in rows:
+        expected = row['wallet__checkpoint_balance'] + row['delta']
+        if expected != row['wallet__balance']:
+            logger.error(
+                'Wallet %s balance %s does not match ledger %s',
+                row['wallet_id'], row['wallet__balance'], expected,
+            )
+            mismatched.append(row['wallet_id'])
+            continue
+        updates.append(Wallet(
+            id=row['wallet_id'],
+            checkpoint_balance=expected,
+            checkpoint_entry_id=row['last_id'],
+            checkpointed_at=now,
+        ))
+
+    Wallet.objects.bulk_update(updates, ['checkpoint_balance', 'checkpoint_entry_id', 'checkpointed_at'])
+    return len(updates), mismatched
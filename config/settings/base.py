@@ -0,0 +1,148 @@
+"""
+Django settings for config project, shared by every profile.
+
+Only what the models, the task worker and management commands need lives
+here; the web stack (admin, sessions, messages, staticfiles, templates) is
+added by ``web``. Pick a profile with DJANGO_SETTINGS_MODULE:
+
+    config.settings.web     runserver / wsgi / asgi (the default)
+    config.settings.worker  manage.py run_tasks and other batch commands
+    config.settings.test    manage.py test (selected automatically)
+    config.settings.bench   benchmarks: web stack without DEBUG overhead
+
+Generated by 'django-admin startproject' using Django 5.2.1.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+import os
+from pathlib import Path
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'django-insecure-x5_op$b=*l8su$)0^qyj1)x_#kcr5d56nqt207zpg37qz^qx!i'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    'backend',
+]
+
+MIDDLEWARE = []
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+}
+
+# Cache
+# Must be shared by every web and worker process: the price table version,
+# pickup slot lists and outlet list are invalidated through it, and a
+# per-process cache (Django's LocMemCache default) would leave the other
+# processes on stale data. The database cache needs `manage.py createcachetable`;
+# point this at Redis or Memcached in production.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            # Culling could evict the pricing version along with old receipts
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    # {
+    #     'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    # },
+    # {
+    #     'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    # },
+    # {
+    #     'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    # },
+    # {
+    #     'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    # },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+AUTH_USER_MODEL = 'backend.CustomUser'
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_URL = 'media/'
+# Emails are printed to the console until an SMTP server is configured
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Background tasks (backend/tasks.py)
+# Run tasks inline instead of waiting for `manage.py run_tasks`
+TASKS_EAGER = False
+TASK_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled on every further attempt
+TASK_RETRY_BACKOFF = 30
+# Seconds a task may stay RUNNING before it is assumed lost and requeued;
+# must be longer than the slowest handler
+TASK_LEASE_TIMEOUT = 600
+
+# Seconds a checkout idempotency key (and its stored response) is kept
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+
+# Gateway used for wallet top-ups (backend/payments.py)
+PAYMENT_GATEWAY = 'backend.payments.FakeGateway'
+
+# Data retention (backend/retention.py, `manage.py apply_retention`)
+# Carts untouched for this many days are deleted
+CART_RETENTION_DAYS = 30
+# Finished orders older than this are moved to the archive table
+ORDER_RETENTION_MONTHS = 12
+RETENTION_BATCH_SIZE = 500
+
+# The order history index lists non-key (covering) columns, which only
+# PostgreSQL uses; on SQLite it is an ordinary index
+SILENCED_SYSTEM_CHECKS = ['models.W040']
@@ -0,0 +1,21 @@
+"""
+Benchmark profile: the web stack with DEBUG off (no query log, no debug
+pages) and a separate database so timing runs do not touch dev data.
+"""
+from .web import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'bench.sqlite3',
+    }
+}
+
+# Fixture users are created in bulk
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
@@ -0,0 +1,13 @@
+"""
+Worker profile for `manage.py run_tasks` and other batch commands.
+
+Loads only auth, contenttypes and the backend app: no admin, templates or
+middleware, and DEBUG stays off so long-running processes do not keep a log
+of every query.
+
+    DJANGO_SETTINGS_MODULE=config.settings.worker python manage.py run_tasks
+"""
+from .base import *  # noqa: F401,F403
+
+# Reuse database connections between polls
+CONN_MAX_AGE = 60
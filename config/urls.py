@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from config import settings
+from django.conf import settings
 
 from django.conf.urls.static import static
 
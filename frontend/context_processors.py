@@ -0,0 +1,9 @@
+from backend.outlets import active_outlets, current_outlet
+
+
+def outlets(request):
+    # Counter picker in the navbar
+    return {
+        'outlets': active_outlets(),
+        'current_outlet': current_outlet(request) if hasattr(request, 'session') else None,
+    }
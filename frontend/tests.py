@@ -1,3 +1,346 @@
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import ProtectedError
 from django.test import TestCase
+from django.utils import timezone
+from django.urls import reverse
+
+from backend import slots, wallet
+from backend.orders import transition
+from backend.models import Cart, Category, CustomUser, IdempotencyKey, Order, OrderItem, Outlet, PickupSlot, \
+    OrderStatus, PriceRule, PriceRuleKind, Product, Receipt
+
+
+class CheckoutIdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        category = Category.objects.create(name='Snacks')
+        self.product = Product.objects.create(name='Samosa', category=category, price=Decimal('10'), qty=100)
+        Cart.objects.create(custom_user=self.user, product=self.product, qty=2)
+        self.client.force_login(self.user)
+
+    def place_order(self, **data):
+        return self.client.post(reverse('place_order'), {'idempotency_key': 'checkout-1', **data})
+
+    def test_resubmit_replays_first_response(self):
+        first = self.place_order(payment_method='CASH')
+        self.assertEqual(first.status_code, 200)
+
+        # The cart is empty now, but the same key still gets the stored success back
+        Cart.objects.create(custom_user=self.user, product=self.product, qty=1)
+        second = self.place_order(payment_method='CASH')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertTrue(Cart.objects.filter(custom_user=self.user).exists())
+
+    def test_order_items_snapshot_prices(self):
+        tea = Product.objects.create(name='Tea', price=Decimal('5'), qty=100)
+        Cart.objects.create(custom_user=self.user, product=tea, qty=3)
+        rule = PriceRule.objects.create(name='Snack deal', kind=PriceRuleKind.CATEGORY, discount_percent=10,
+                                        category=self.product.category)
+        self.assertEqual(self.place_order(payment_method='CASH').status_code, 200)
+
+        order = Order.objects.get()
+        items = {item.product_id: (item.unit_price, item.discount, item.amount) for item in order.order_items.all()}
+        self.assertEqual(items, {
+            self.product.id: (Decimal('10'), 10, Decimal('18')),
+            tea.id: (Decimal('5'), 0, Decimal('15')),
+        })
+        self.assertEqual(order.total_amount, Decimal('33'))
+
+        # Later price changes do not touch the placed order
+        self.product.price = Decimal('12')
+        self.product.save()
+        rule.delete()
+        self.assertEqual(OrderItem.objects.get(product=self.product).amount, Decimal('18'))
+
+    def test_header_key(self):
+        for _ in range(2):
+            response = self.client.post(
+                reverse('place_order'), {'payment_method': 'CASH'}, HTTP_IDEMPOTENCY_KEY='header-key'
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_attempt_is_not_stored(self):
+        response = self.place_order(payment_method='WALLET')
+        self.assertEqual(response.status_code, 402)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+        # Topping up and resubmitting the same form now goes through
+        wallet.credit(self.user, '50')
+        response = self.place_order(payment_method='WALLET')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(wallet.get_balance(self.user), Decimal('30'))
+
+    def test_full_slot_then_other_slot(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        full = PickupSlot.objects.create(
+            date=tomorrow, start_time=datetime.time(12, 0), end_time=datetime.time(12, 15), capacity=1, reserved=1
+        )
+        other = PickupSlot.objects.create(
+            date=tomorrow, start_time=datetime.time(12, 15), end_time=datetime.time(12, 30), capacity=1
+        )
+        self.assertEqual(self.place_order(payment_method='CASH', pickup_slot=full.id).status_code, 409)
+        response = self.place_order(payment_method='CASH', pickup_slot=other.id)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Order.objects.get().pickup_slot, other)
+
+    def test_past_slot_is_refused(self):
+        yesterday = PickupSlot.objects.create(
+            date=datetime.date.today() - datetime.timedelta(days=1),
+            start_time=datetime.time(12, 0), end_time=datetime.time(12, 15), capacity=5,
+        )
+        self.assertEqual(self.place_order(payment_method='CASH', pickup_slot=yesterday.id).status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_slot(self):
+        response = self.place_order(payment_method='CASH', pickup_slot='abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OutletTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.category = Category.objects.create(name='Snacks')
+        self.shared = Product.objects.create(name='Samosa', category=self.category, price=Decimal('10'), qty=100)
+        self.legacy_row = Cart.objects.create(custom_user=self.user, product=self.shared, qty=1)
+        self.main = Outlet.objects.create(name='Main', code='main')
+        self.east = Outlet.objects.create(name='East', code='east')
+        self.tea = Product.objects.create(
+            name='Masala Tea', category=self.category, price=Decimal('5'), qty=100, outlet=self.east
+        )
+        self.client.force_login(self.user)
+        self.client.get(reverse('set_outlet', args=['main']))
+
+    def test_existing_rows_survive_first_outlet(self):
+        response = self.client.get(reverse('home'), {'category': 'Snacks'})
+        self.assertContains(response, 'Samosa')
+        self.assertNotContains(response, 'Masala Tea')
+        response = self.client.get(reverse('cart'))
+        self.assertEqual([item.pk for item in response.context['cart_items']], [self.legacy_row.pk])
+
+    def test_product_of_other_outlet_is_rejected(self):
+        self.client.get(reverse('add_to_cart', args=[self.tea.id]))
+        self.assertFalse(Cart.objects.filter(product=self.tea).exists())
+
+        self.client.get(reverse('set_outlet', args=['east']))
+        self.client.get(reverse('add_to_cart', args=[self.tea.id]))
+        self.assertEqual(Cart.objects.get(product=self.tea).outlet, self.east)
+
+    def test_order_numbers_per_outlet(self):
+        response = self.client.post(reverse('place_order'), {'payment_method': 'CASH'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertRegex(response.json()['order_number'], r'^MAIN \d{4}-\d{2}-\d{2} 001$')
+        self.assertEqual(Order.objects.get().outlet, self.main)
+
+    def test_outlet_codes_are_case_insensitive(self):
+        self.assertEqual(Outlet.objects.create(name='West', code='WEST').code, 'west')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Outlet.objects.create(name='Main again', code='MAIN')
+        with self.assertRaises(ValidationError):
+            Outlet(name='Main again', code='Main').full_clean()
+
+        self.client.get(reverse('set_outlet', args=['EAST']))
+        self.client.get(reverse('add_to_cart', args=[self.tea.id]))
+        self.assertEqual(Cart.objects.get(product=self.tea).outlet, self.east)
+
+    def test_outlet_in_use_cannot_be_deleted(self):
+        # Deleting would turn its products (and orders) into shared ones
+        with self.assertRaises(ProtectedError):
+            self.east.delete()
+        self.assertEqual(Product.objects.get(pk=self.tea.pk).outlet, self.east)
+
+    def test_shared_slots_are_offered(self):
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        shared = PickupSlot.objects.create(
+            date=tomorrow, start_time=datetime.time(12, 0), end_time=datetime.time(12, 15), capacity=1
+        )
+        own = PickupSlot.objects.create(
+            date=tomorrow, start_time=datetime.time(12, 15), end_time=datetime.time(12, 30), capacity=1,
+            outlet=self.east,
+        )
+        self.assertEqual([slot['id'] for slot in slots.available_slots(tomorrow, self.main)], [shared.id])
+        self.assertEqual([slot['id'] for slot in slots.available_slots(tomorrow, self.east)], [shared.id, own.id])
+
+        # Filling the shared slot drops it from every outlet's cached list
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNotNone(slots.reserve(shared.id, outlet=self.main))
+        self.assertEqual(slots.available_slots(tomorrow, self.main), [])
+        self.assertEqual([slot['id'] for slot in slots.available_slots(tomorrow, self.east)], [own.id])
+        self.assertIsNone(slots.reserve(own.id, outlet=self.main))
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.samosa = Product.objects.create(name='Samosa', price=Decimal('10'), qty=100)
+        self.tea = Product.objects.create(name='Tea', price=Decimal('5'), qty=100)
+        self.client.force_login(self.user)
+
+    def order(self, customer, *quantities):
+        order = Order.objects.create(customer=customer, total_amount=0)
+        for product, qty in quantities:
+            OrderItem.objects.create(order=order, product=product, qty=qty, unit_price=5, amount=5 * qty, discount=0)
+        return order
+
+    def cart(self):
+        return dict(Cart.objects.filter(custom_user=self.user).values_list('product_id', 'qty'))
+
+    def test_reorder_last_merges_into_cart(self):
+        self.order(self.user, (self.tea, 3))
+        self.order(self.user, (self.samosa, 2), (self.tea, 1))
+        Cart.objects.create(custom_user=self.user, product=self.samosa, qty=1)
+        response = self.client.get(reverse('reorder_last'))
+        self.assertRedirects(response, reverse('cart'), fetch_redirect_response=False)
+        self.assertEqual(self.cart(), {self.samosa.id: 3, self.tea.id: 1})
+
+    def test_reorder_by_id(self):
+        first = self.order(self.user, (self.tea, 3))
+        self.order(self.user, (self.samosa, 2))
+        self.client.get(reverse('reorder', args=[first.id]))
+        self.assertEqual(self.cart(), {self.tea.id: 3})
+
+    def test_cannot_reorder_someone_elses_order(self):
+        other = CustomUser.objects.create_user('other@example.com', 'pw', phone='2')
+        order = self.order(other, (self.tea, 1))
+        self.assertEqual(self.client.get(reverse('reorder', args=[order.id])).status_code, 404)
+        self.assertEqual(self.cart(), {})
+
+    def test_nothing_to_reorder(self):
+        self.client.get(reverse('reorder_last'))
+        self.assertEqual(self.cart(), {})
+        deleted = Product.objects.create(name='Gone', price=Decimal('1'), qty=1)
+        self.order(self.user, (deleted, 1))
+        deleted.delete()
+        self.client.get(reverse('reorder_last'))
+        self.assertEqual(self.cart(), {})
+
+
+class KitchenTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user('staff@example.com', 'pw', phone='1', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_bad_date_falls_back_to_today(self):
+        for value in ['2024-02-30', 'not-a-date', '']:
+            response = self.client.get(reverse('kitchen'), {'date': value})
+            self.assertEqual(response.status_code, 200, value)
+
+    def test_customers_are_sent_to_login(self):
+        customer = CustomUser.objects.create_user('customer@example.com', 'pw', phone='2')
+        self.client.force_login(customer)
+        self.assertEqual(self.client.get(reverse('kitchen')).status_code, 302)
+
+
+class WalletTopUpTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.client.force_login(self.user)
+
+    def top_up(self, amount, token='tok_visa'):
+        return self.client.post(reverse('wallet'), {'amount': amount, 'payment_token': token})
+
+    def test_top_up(self):
+        self.assertRedirects(self.top_up('25.50'), reverse('wallet'))
+        self.assertEqual(wallet.get_balance(self.user), Decimal('25.50'))
+
+    def test_bad_amounts_are_never_charged(self):
+        with mock.patch('backend.payments.FakeGateway.charge') as charge:
+            for amount in ['Infinity', '99999999999', '0.001', 'abc', '-1']:
+                self.assertRedirects(self.top_up(amount), reverse('wallet'), msg_prefix=amount)
+        charge.assert_not_called()
+        self.assertEqual(wallet.get_balance(self.user), Decimal('0'))
+
+    def test_declined_card(self):
+        self.top_up('10', token='decline')
+        self.assertEqual(wallet.get_balance(self.user), Decimal('0'))
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('customer@example.com', 'pw', phone='1')
+        self.other = CustomUser.objects.create_user('other@example.com', 'pw', phone='2')
+        self.product = Product.objects.create(name='Samosa', price=Decimal('10'), qty=100)
+        self.client.force_login(self.user)
+
+    def order(self, customer=None):
+        order = Order.objects.create(customer=customer or self.user, total_amount=Decimal('20'))
+        OrderItem.objects.create(order=order, product=self.product, qty=2, unit_price=10, amount=20, discount=0)
+        return order
+
+    def test_keyset_pages_cover_every_order_once(self):
+        orders = [self.order() for _ in range(25)]
+        self.order(customer=self.other)
+        # Ties on order_date straddle the page boundary and are broken by id
+        same_time = timezone.now() - datetime.timedelta(hours=1)
+        Order.objects.filter(pk__in=[order.pk for order in orders[2:10]]).update(order_date=same_time)
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get(reverse('my_orders'), {'before': cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            seen += [order.pk for order in response.context['orders']]
+            pages += 1
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, 2)
+        self.assertEqual(sorted(seen), sorted(order.pk for order in orders))
+        self.assertEqual(len(seen), len(set(seen)))
+        expected = Order.objects.filter(customer=self.user).order_by('-order_date', '-id')
+        self.assertEqual(seen, [order.pk for order in expected])
+
+    def test_bad_cursor_redirects(self):
+        for cursor in ['2024-13-45T00:00:00_5', 'garbage', '2024-01-01T00:00:00_x']:
+            response = self.client.get(reverse('my_orders'), {'before': cursor})
+            self.assertRedirects(response, reverse('my_orders'), msg_prefix=cursor)
+
+    def test_receipt_access(self):
+        order = self.order()
+        url = reverse('receipt', args=[order.order_number])
+        # Not approved yet
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        transition([order.id], OrderStatus.APPROVED)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertContains(response, order.order_number)
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        staff = CustomUser.objects.create_user('staff@example.com', 'pw', phone='3', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_receipt_is_immutable(self):
+        order = self.order()
+        transition([order.id], OrderStatus.APPROVED)
+        receipt = Receipt.objects.get(order_number=order.order_number)
+        self.assertIn('Samosa', receipt.content)
+
+        receipt.content = 'changed'
+        with self.assertRaises(ValueError):
+            receipt.save()
 
-# Create your tests here.
+        # Later catalog changes do not alter the stored receipt
+        self.product.name = 'Renamed'
+        self.product.save()
+        cache.clear()
+        response = self.client.get(reverse('receipt', args=[order.order_number]))
+        self.assertContains(response, 'Samosa')
+        self.assertNotContains(response, 'Renamed')
@@ -1,7 +1,8 @@
 from django.urls import path
 
 from frontend.views import home, auth_login, auth_logout, register, cart, add_to_cart, increase_quantity, \
-    decrease_quantity, remove_from_cart, clear_cart, proceed_to_checkout, place_order
+    decrease_quantity, remove_from_cart, clear_cart, proceed_to_checkout, place_order, reorder, kitchen, \
+    update_order_status, wallet, my_orders, receipt, set_outlet
 
 urlpatterns = [
     path('', home, name="home"),
@@ -10,10 +11,18 @@ urlpatterns = [
     path('register', register, name='register'),
     path('cart', cart, name='cart'),
     path('add-to-cart/<int:product_id>/', add_to_cart, name='add_to_cart'),
+    path('reorder/', reorder, name='reorder_last'),
+    path('reorder/<int:order_id>/', reorder, name='reorder'),
     path('cart/increase/<int:id>/', increase_quantity, name='increase_quantity'),
     path('cart/decrease/<int:id>/', decrease_quantity, name='decrease_quantity'),
     path('cart/remove/<int:id>/', remove_from_cart, name='remove_from_cart'),
     path('cart/clear/', clear_cart, name='clear_cart'),
     path('proceed_to_checkout/', proceed_to_checkout, name='proceed_to_checkout'),
     path('place-order/', place_order, name='place_order'),
+    path('outlet/<slug:code>/', set_outlet, name='set_outlet'),
+    path('kitchen/', kitchen, name='kitchen'),
+    path('wallet/', wallet, name='wallet'),
+    path('orders/', my_orders, name='my_orders'),
+    path('orders/<str:order_number>/receipt/', receipt, name='receipt'),
+    path('orders/status/', update_order_status, name='update_order_status'),
 ]
\ No newline at end of file
@@ -1,33 +1,66 @@
+import json
+import uuid
+
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import render, get_object_or_404, redirect
 
-from backend.models import Cart, CustomUser, Gender, Category, Product, Order, OrderItem
+from backend.models import Cart, CustomUser, Gender, Category, Product, Order, OrderItem, PaymentMethodStatus, \
+    WalletEntry
+from backend.outlets import current_outlet, select_outlet
 
 from django.contrib.auth.hashers import make_password
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, Http404
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import require_POST
+
+# Feature modules (pricing, wallet, slots, ...) are imported inside the views
+# that use them, so loading the URLconf stays cheap.
+
+# Same check as the admin's staff_member_required without importing the admin
+staff_member_required = user_passes_test(lambda u: u.is_active and u.is_staff, login_url='admin:login')
+
+def outlet_products(outlet):
+    # The current counter's products plus the shared ones (no outlet)
+    products = Product.objects.all()
+    if outlet is None:
+        return products
+    return products.filter(Q(outlet=outlet) | Q(outlet__isnull=True))
 
 # Create your views here.
 def home(request):
+    from backend.recommendations import get_recommendations
+
     user = request.user
+    outlet = current_outlet(request)
     data = {}
 
     # Handle cart data for authenticated users
     if user.is_authenticated:
-        cart_items = Cart.objects.filter(custom_user=user)
-        grand_total = Cart.grand_total(customer_id=user.id)
+        cart_items = Cart.for_user(user, outlet)
+        grand_total = Cart.grand_total(customer_id=user.id, staff=user.is_staff, outlet=outlet)
 
         data['cart_items'] = cart_items
         data['grand_total'] = grand_total
         data['cart_count'] = cart_items.count()
+
+        # Favourites come from the cached recommendation structure
+        top = get_recommendations(user.id)['top']
+        products = outlet_products(outlet).in_bulk(top)
+        data['favourites'] = [products[pid] for pid in top if pid in products]
+        data['has_orders'] = Order.objects.filter(customer=user).exists()
     else:
         data['cart_items'] = []
         data['grand_total'] = 0
         data['cart_count'] = 0
 
-    # Load all categories for navbar or dropdowns
-    categories = Category.objects.prefetch_related('products').all()
+    # Load all categories for navbar or dropdowns, with this outlet's products only
+    categories = Category.objects.prefetch_related(
+        Prefetch('products', queryset=outlet_products(outlet))
+    ).all()
     data['categories'] = categories
 
     # Category filter check
@@ -101,6 +134,9 @@ def register(request):
 
 @login_required  # Ensures the user is authenticated
 def cart(request):
+    from backend.pricing import quote
+    from backend.recommendations import suggestions_for
+
     # Get the current logged-in user
     user = request.user
 
@@ -109,17 +145,27 @@ def cart(request):
         print(user.email)
 
         # Filter cart items for the current user
-        cart_items = Cart.objects.filter(custom_user=user)
+        outlet = current_outlet(request)
+        cart_items = list(Cart.for_user(user, outlet).select_related('product'))
 
-        # Calculate the grand total for the cart
-        grand_total = Cart.grand_total(customer_id=user.id)
+        # Price the cart once; each row gets its priced line for the template
+        priced = quote(cart_items, staff=user.is_staff)
+        lines = iter(priced.lines)
+        for item in cart_items:
+            item.line = next(lines) if item.product_id else None
+        grand_total = priced.total
 
         # Prepare the data to be passed to the template
         data = {
             'cart_items': cart_items,  # Pass the filtered cart items to the template
             'grand_total': grand_total,
             'page_title': 'Cart',  # You can set the page title as per your requirement
-            'cart_count': cart_items.count()
+            'discount_total': priced.discount_total,
+            'cart_count': len(cart_items),
+            # "Goes well with" suggestions for what is already in the cart
+            'suggestions': outlet_products(outlet).filter(
+                id__in=suggestions_for([item.product_id for item in cart_items])
+            ),
         }
     else:
         # If the user is not authenticated, handle accordingly
@@ -136,12 +182,17 @@ def add_to_cart(request, product_id):
     # Get the product the user wants to add
     product = get_object_or_404(Product, id=product_id)
 
+    # Only the current counter's products (or shared ones) can go in its cart
+    outlet = current_outlet(request)
+    if product.outlet_id and (outlet is None or product.outlet_id != outlet.pk):
+        messages.error(request, f'{product.name} is not sold at this counter.')
+        return redirect('home')
+
     # Check if this product already exists in the user's cart
-    cart_item, created = Cart.objects.get_or_create(
-        product=product,
-        custom_user=request.user,  # Use your user field name
-        defaults={'qty': 1}
-    )
+    cart_item = Cart.for_user(request.user, outlet).filter(product=product).first()
+    created = cart_item is None
+    if created:
+        cart_item = Cart.objects.create(product=product, custom_user=request.user, outlet=outlet, qty=1)
 
     if not created:
         # Product already in cart, increase quantity
@@ -153,6 +204,34 @@ def add_to_cart(request, product_id):
 
     return redirect('cart')  # Or redirect to product detail page
 
+@login_required
+def reorder(request, order_id=None):
+    # Copy a past order (the latest one by default) back into the cart
+    orders = Order.objects.filter(customer=request.user)
+    if order_id is None:
+        order = orders.order_by('-order_date', '-id').first()
+    else:
+        order = get_object_or_404(orders, id=order_id)
+
+    if order is None:
+        messages.error(request, 'You have no previous orders.')
+        return redirect('cart')
+
+    quantities = dict(
+        order.order_items.filter(product__isnull=False)
+        .values_list('product_id')
+        .annotate(qty=Sum('qty'))
+    )
+    if not quantities:
+        messages.error(request, 'None of the items in that order are available any more.')
+        return redirect('cart')
+
+    Cart.add_products(request.user, quantities, outlet=order.outlet)
+    if order.outlet:
+        select_outlet(request, order.outlet.code)
+    messages.success(request, f'Items from order #{order.order_number} added to your cart.')
+    return redirect('cart')
+
 @login_required
 def increase_quantity(request, id):
     cart_item = get_object_or_404(Cart, id=id, custom_user=request.user)
@@ -195,7 +274,7 @@ def remove_from_cart(request, id):
 
 @login_required
 def clear_cart(request):
-    cart_items = Cart.objects.filter(custom_user=request.user)
+    cart_items = Cart.for_user(request.user, current_outlet(request))
 
     if cart_items.exists():
         cart_items.delete()
@@ -207,13 +286,22 @@ def clear_cart(request):
 
 @login_required
 def proceed_to_checkout(request):
+    from backend.pricing import quote
+    from backend.slots import available_slots
+    from backend.wallet import get_balance
+
     user = request.user
+    outlet = current_outlet(request)
 
     # Filter cart items for the current user
-    cart_items = Cart.objects.filter(custom_user=user)
+    cart_items = list(Cart.for_user(user, outlet).select_related('product'))
 
-    # Calculate subtotal
-    subtotal = sum(item.product.price * item.qty for item in cart_items)
+    # Calculate subtotal with discounts applied
+    priced = quote(cart_items, staff=user.is_staff)
+    lines = iter(priced.lines)
+    for item in cart_items:
+        item.line = next(lines) if item.product_id else None
+    subtotal = priced.total
 
     # Define a fixed shipping charge (you can also calculate dynamically)
     shipping = 50 if cart_items else 0  # ₹50 shipping if there are items
@@ -225,68 +313,246 @@ def proceed_to_checkout(request):
     data = {
         'cart_items': cart_items,
         'subtotal': subtotal,
+        'discount_total': priced.discount_total,
         'shipping': shipping,
         'total': total,
         'page_title': 'Cart',
-        'cart_count': cart_items.count(),
+        'cart_count': len(cart_items),
+        # Sent back with the form so a resubmit cannot place the order twice
+        'idempotency_key': uuid.uuid4().hex,
+        'pickup_slots': available_slots(outlet=outlet),
+        'wallet_balance': get_balance(user),
     }
 
     return render(request, 'frontend/order.html', data)
 
 @login_required
 def place_order(request):
+    from backend.idempotency import get_key, replay, run_once
+    from backend.pricing import quote
+    from backend.slots import reserve
+    from backend.tasks import enqueue
+    from backend.wallet import debit, InsufficientBalance
+
     user = request.user
-    cart_items = Cart.objects.filter(custom_user=user)
+
+    # A retried or double-clicked submit gets the first response back
+    key = get_key(request)
+    stored = replay(user, key)
+    if stored is not None:
+        return stored
+
+    outlet = current_outlet(request)
+    cart_items = Cart.for_user(user, outlet)
 
     if not cart_items.exists():
         messages.warning(request, "Your cart is empty.")
         return redirect('cart')
 
-    # Calculate total amount
-    total_amount = sum(item.product.price * item.qty for item in cart_items)
+    slot_id = request.POST.get('pickup_slot') or None
+    if slot_id is not None:
+        try:
+            slot_id = int(slot_id)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid pickup slot.'}, status=400)
+    payment_method = request.POST.get('payment_method', 'UPI')  # Default to 'UPI' if not provided
+
+    def create_order():
+        # Reserve the pickup slot first; the reservation rolls back with the order
+        slot = None
+        if slot_id:
+            slot = reserve(slot_id, outlet=outlet)
+            if slot is None:
+                return 409, {'success': False, 'error': 'The selected pickup slot is full or no longer available.'}
+
+        # Price the cart from the compiled price table
+        priced = quote(cart_items, staff=user.is_staff)
+
+        # Create the order
+        order = Order.objects.create(
+            customer=user,
+            total_amount=priced.total,
+            payment_method=payment_method,
+            order_status='PENDING',
+            pickup_slot=slot,
+            outlet=outlet,
+        )
 
-    # Create the order
-    order = Order.objects.create(
-        customer=user,
-        total_amount=total_amount,
-        payment_method=request.POST.get('payment_method', 'UPI'),  # Default to 'CASH' if not provided
-        order_status='PENDING'
-    )
+        # Create order items, snapshotting the price and discount applied
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                qty=line.qty,
+                unit_price=line.unit_price,
+                amount=line.amount,
+                discount=line.discount,
+            )
+            for line in priced.lines
+        ])
 
-    # Create order items
-    for item in cart_items:
-        OrderItem.objects.create(
-            order=order,
-            product=item.product,
-            qty=item.qty,
-            unit_price=item.product.price,
-            amount=item.product.price * item.qty,
-            discount=0  # Adjust if you have discount logic
+        # Wallet orders are paid now; a short balance undoes everything above
+        if payment_method == PaymentMethodStatus.WALLET and priced.total > 0:
+            debit(user, priced.total, order=order, reference=f"order:{order.order_number}")
+
+        # Clear the cart
+        cart_items.delete()
+
+        # Side effects run in the background so checkout returns immediately
+        enqueue(
+            'backend.tasks.send_order_confirmation',
+            {'order_id': order.id},
+            key=f"order-confirmation:{order.id}",
+        )
+        enqueue(
+            'backend.recommendations.record_order',
+            {'order_id': order.id},
+            key=f"order-recommendations:{order.id}",
         )
 
-    # Clear the cart
-    cart_items.delete()
-
-    # Send confirmation email
-    subject = f"Order Confirmation - {order.order_number}"
-    message = (
-        f"Dear {user.first_name},\n\n"
-        f"Thank you for your order #{order.order_number}.\n"
-        f"Total Amount: ₹{order.total_amount}\n\n"
-        f"We will notify you once your order is shipped.\n\n"
-        f"Best regards,\n"
-        f"Your Company Name"
+        messages.success(request, f"Order #{order.order_number} placed successfully!")
+        # return redirect('home')  # Redirect to a success page or order summary
+
+        # Return success response
+        return 200, {'success': True, 'order_number': order.order_number}
+
+    def checkout():
+        try:
+            with transaction.atomic():
+                return create_order()
+        except InsufficientBalance as e:
+            return 402, {'success': False, 'error': str(e)}
+
+    # The order, its items and the key commit together, at most once per key
+    return run_once(user, key, checkout)
+
+
+@staff_member_required
+def kitchen(request):
+    from backend.slots import kitchen_batches
+
+    # PENDING orders batched by pickup slot with per-product totals, for one counter
+    if request.GET.get('outlet'):
+        select_outlet(request, request.GET['outlet'])
+    outlet = current_outlet(request)
+    try:
+        date = parse_date(request.GET.get('date', ''))
+    except ValueError:
+        # Well-formed but impossible, e.g. 2024-02-30; show today like any other bad value
+        date = None
+    data = {
+        'batches': kitchen_batches(date, outlet=outlet),
+        'outlet': outlet,
+        'page_title': 'Kitchen',
+    }
+    return render(request, 'frontend/kitchen.html', data)
+
+
+@staff_member_required
+@require_POST
+def update_order_status(request):
+    # Bulk PENDING -> APPROVED/REJECTED, e.g. approving a whole pickup slot from the kitchen page.
+    # Accepts a JSON body {"order_ids": [...], "status": "APPROVED"} or the same as form fields.
+    from backend.orders import transition
+
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON.'}, status=400)
+        order_ids, status = payload.get('order_ids', []), payload.get('status')
+    else:
+        order_ids, status = request.POST.getlist('order_ids'), request.POST.get('status')
+
+    try:
+        order_ids = [int(order_id) for order_id in order_ids]
+        changed = transition(order_ids, status)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({'success': True, 'updated': len(changed), 'order_ids': changed})
+
+
+@login_required
+def wallet(request):
+    from backend.payments import get_gateway, PaymentError
+    from backend.wallet import credit, get_balance, parse_amount
+
+    user = request.user
+
+    if request.method == 'POST':
+        # Top up through the payment gateway, then credit the charge to the wallet
+        # The amount is validated before anything is charged
+        try:
+            amount = parse_amount(request.POST.get('amount', ''))
+        except ValueError as e:
+            messages.error(request, f'Enter a valid amount. {e}')
+            return redirect('wallet')
+        try:
+            charge_id = get_gateway().charge(amount, request.POST.get('payment_token', ''))
+        except PaymentError as e:
+            messages.error(request, f'Top-up failed: {e}')
+        else:
+            credit(user, amount, reference=charge_id)
+            messages.success(request, f'₹{amount} added to your wallet.')
+        return redirect('wallet')
+
+    data = {
+        'balance': get_balance(user),
+        'entries': WalletEntry.objects.filter(wallet__user=user).select_related('order').order_by('-id')[:20],
+        'page_title': 'Wallet',
+        'cart_count': Cart.for_user(user, current_outlet(request)).count(),
+    }
+    return render(request, 'frontend/wallet.html', data)
+
+
+ORDERS_PER_PAGE = 20
+
+@login_required
+def my_orders(request):
+    # Keyset pagination on (order_date, id) so deep pages cost the same as the first
+    orders = Order.objects.filter(customer=request.user).order_by('-order_date', '-id').only(
+        'id', 'order_number', 'order_date', 'total_amount', 'order_status', 'customer_id'
     )
-    # send_mail(
-    #     subject,
-    #     message,
-    #     settings.DEFAULT_FROM_EMAIL,
-    #     [user.email],
-    #     fail_silently=False,
-    # )
-
-    messages.success(request, f"Order #{order.order_number} placed successfully!")
-    # return redirect('home')  # Redirect to a success page or order summary
-
-    # Return success response
-    return JsonResponse({'success': True})
\ No newline at end of file
+
+    cursor = request.GET.get('before', '')
+    if cursor:
+        timestamp, _, last_id = cursor.rpartition('_')
+        try:
+            before = parse_datetime(timestamp)
+        except ValueError:
+            # Well-formed but impossible, e.g. month 13
+            before = None
+        if before is None or not last_id.isdigit():
+            return redirect('my_orders')
+        orders = orders.filter(Q(order_date__lt=before) | Q(order_date=before, id__lt=int(last_id)))
+
+    page = list(orders[:ORDERS_PER_PAGE + 1])
+    next_cursor = None
+    if len(page) > ORDERS_PER_PAGE:
+        page = page[:ORDERS_PER_PAGE]
+        last = page[-1]
+        next_cursor = f"{last.order_date.isoformat()}_{last.id}"
+
+    data = {
+        'orders': page,
+        'next_cursor': next_cursor,
+        'page_title': 'My Orders',
+        'cart_count': Cart.for_user(request.user, current_outlet(request)).count(),
+    }
+    return render(request, 'frontend/my_orders.html', data)
+
+@login_required
+def receipt(request, order_number):
+    from backend.receipts import get_receipt
+
+    receipt = get_receipt(order_number)
+    if receipt is None or (receipt.customer_id != request.user.id and not request.user.is_staff):
+        raise Http404('Receipt not found.')
+    return HttpResponse(receipt.content, content_type='text/plain; charset=utf-8')
+
+
+def set_outlet(request, code):
+    if select_outlet(request, code) is None:
+        messages.error(request, 'That counter is not available.')
+    return redirect('home')